@@ -0,0 +1,59 @@
+"""Пользователь запроса из кеша объектов вместо запроса к базе.
+
+Повторяет django.contrib.auth.get_user: проверяются бэкенд сессии,
+is_active и хеш сессии, поэтому смена пароля и выход по-прежнему
+разлогинивают. Отличается только источник пользователя — он читается
+через core.object_cache и сбрасывается сигналами сохранения User.
+"""
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.auth.models import AnonymousUser
+from django.utils.crypto import constant_time_compare
+from django.utils.functional import SimpleLazyObject
+
+from core.object_cache import cached_object
+
+
+def load_user(backend, user_id):
+    if not isinstance(backend, ModelBackend):
+        return backend.get_user(user_id)
+    user = cached_object(auth.get_user_model(), 'pk', user_id)
+    if user is None or not backend.user_can_authenticate(user):
+        return None
+    return user
+
+
+def get_user(request):
+    User = auth.get_user_model()
+    try:
+        user_id = User._meta.pk.to_python(request.session[auth.SESSION_KEY])
+        backend_path = request.session[auth.BACKEND_SESSION_KEY]
+    except KeyError:
+        return AnonymousUser()
+    if backend_path not in settings.AUTHENTICATION_BACKENDS:
+        return AnonymousUser()
+    user = load_user(auth.load_backend(backend_path), user_id)
+    if hasattr(user, 'get_session_auth_hash'):
+        session_hash = request.session.get(auth.HASH_SESSION_KEY)
+        if not (session_hash and constant_time_compare(
+                session_hash, user.get_session_auth_hash())):
+            request.session.flush()
+            user = None
+    return user or AnonymousUser()
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    """AuthenticationMiddleware, который берёт пользователя из кеша.
+    """
+
+    def process_request(self, request):
+        super().process_request(request)
+        request.user = SimpleLazyObject(lambda: self.get_user(request))
+
+    @staticmethod
+    def get_user(request):
+        if not hasattr(request, '_cached_user'):
+            request._cached_user = get_user(request)
+        return request._cached_user
@@ -0,0 +1,446 @@
+"""Двухуровневый кеш для нескольких процессов-воркеров.
+
+L1 — LRU в памяти процесса, ограниченный числом записей и объёмом.
+L2 — общий для всех процессов файл SQLite. Каждая запись в L2
+попадает в журнал инвалидаций; перед чтением процесс не чаще
+SYNC_INTERVAL секунд дочитывает журнал и выбрасывает из своего L1
+ключи, изменённые другими процессами.
+
+Свои записи процесс кладёт в L1 сразу после COMMIT под блокировкой
+L1, поэтому они попадают туда в том же порядке, что и в L2. Чтение
+из L2 заполняет L1, только если за время чтения L1 никто не менял
+(ни запись, ни синхронизация): иначе прочитанное значение могло
+устареть. L2 ограничен MAX_ENTRIES, как у DatabaseCache.
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.cache_backends.TieredCache',
+            'LOCATION': '/path/to/cache.sqlite3',
+            'OPTIONS': {
+                'L1_MAX_ENTRIES': 1000,
+                'L1_MAX_BYTES': 64 * 1024 * 1024,
+                'SYNC_INTERVAL': 0.5,
+                'MAX_ENTRIES': 10000,
+            },
+        },
+    }
+"""
+import os
+import pickle
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from uuid import uuid4
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+# Маркер в журнале: другой процесс очистил кеш целиком
+CLEAR_ALL = '*'
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache_entry ('
+    ' key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL)',
+    'CREATE TABLE IF NOT EXISTS cache_log ('
+    ' seq INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT NOT NULL,'
+    ' origin TEXT NOT NULL, at REAL NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS cache_log_at_idx ON cache_log (at)',
+)
+
+
+class LRU:
+    """Потокобезопасный LRU из ключа в (pickle-значение, срок).
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if entry[1] is not None and entry[1] <= time.time():
+                self._pop(key)
+                return None
+            self._data.move_to_end(key)
+            return entry
+
+    def set(self, key: str, pickled: bytes, expires) -> None:
+        with self._lock:
+            self._pop(key)
+            if len(pickled) > self.max_bytes:
+                return
+            self._data[key] = (pickled, expires)
+            self.size += len(pickled)
+            while (len(self._data) > self.max_entries
+                   or self.size > self.max_bytes):
+                self._pop(next(iter(self._data)))
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._pop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+    def _pop(self, key: str) -> None:
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[0])
+
+
+class _ProcessTier:
+    """L1 процесса и его позиция в журнале. Django создаёт экземпляр
+    бэкенда на каждый поток, поэтому L1 хранится на уровне модуля,
+    как у LocMemCache.
+    """
+
+    def __init__(self, l1: LRU, seen: int):
+        self.l1 = l1
+        self.seen = seen
+        self.synced_at = time.time()
+        self.origin = f'{os.getpid()}-{uuid4().hex}'
+        self.lock = threading.Lock()
+        # Растёт при каждом изменении L1 записью или синхронизацией
+        self.generation = 0
+
+
+_tiers = {}
+_tiers_lock = threading.Lock()
+
+
+class TieredCache(BaseCache):
+    """Кеш с L1 в памяти процесса поверх общего L2 в SQLite.
+    """
+    # Сколько секунд журнал инвалидаций хранит записи. Процесс, который
+    # не синхронизировался дольше, очищает свой L1 целиком
+    log_retention = 300
+    # Доля записей, после которых удаляются просроченные строки,
+    # а если записей в L2 больше MAX_ENTRIES — и часть живых
+    cull_probability = 0.01
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.path = os.path.abspath(location)
+        self.sync_interval = float(options.get('SYNC_INTERVAL', 0.5))
+        self.l1_max_entries = int(options.get('L1_MAX_ENTRIES', 1000))
+        self.l1_max_bytes = int(options.get('L1_MAX_BYTES', 64 * 1024 * 1024))
+        self._local = threading.local()
+
+    @property
+    def tier(self) -> _ProcessTier:
+        """L1 текущего процесса; после fork у потомка он свой.
+        """
+        name = (self.path, os.getpid())
+        tier = _tiers.get(name)
+        if tier is None:
+            with _tiers_lock:
+                tier = _tiers.get(name)
+                if tier is None:
+                    seen = self._open().execute(
+                        'SELECT COALESCE(MAX(seq), 0) FROM cache_log'
+                    ).fetchone()[0]
+                    tier = _ProcessTier(
+                        LRU(self.l1_max_entries, self.l1_max_bytes), seen)
+                    _tiers[name] = tier
+        return tier
+
+    @property
+    def l1(self) -> LRU:
+        return self.tier.l1
+
+    def _open(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(
+                self.path, timeout=30, isolation_level=None,
+                check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            for statement in SCHEMA:
+                connection.execute(statement)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _connection(self):
+        return _Transaction(self._open())
+
+    @contextmanager
+    def _writing(self):
+        """Пишущая транзакция L2. Выдаёт соединение и словарь изменений
+        ключ -> (pickle, срок) или None для удалённых; по ним пишется
+        журнал, а после COMMIT правится L1.
+
+        BEGIN IMMEDIATE сразу берёт блокировку, чтобы чтение и запись
+        в incr и add были атомарны для других процессов. COMMIT и правка
+        L1 идут под блокировкой L1: два потока процесса не переставят
+        свои значения в L1 относительно L2.
+        """
+        tier = self.tier
+        connection = self._open()
+        changes = {}
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection, changes
+            if random.random() < self.cull_probability:
+                self._cull(connection, changes)
+            if changes:
+                self._log(connection, *changes)
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        with tier.lock:
+            connection.execute('COMMIT')
+            tier.generation += 1
+            for key, entry in changes.items():
+                if key == CLEAR_ALL:
+                    tier.l1.clear()
+                elif entry is None:
+                    tier.l1.delete(key)
+                else:
+                    tier.l1.set(key, *entry)
+
+    def _sync(self) -> None:
+        """Выбрасывает из L1 ключи, которые изменили другие процессы.
+        """
+        tier = self.tier
+        now = time.time()
+        if now - tier.synced_at < self.sync_interval:
+            return
+        with tier.lock:
+            with self._connection() as connection:
+                rows = connection.execute(
+                    'SELECT seq, key, origin FROM cache_log WHERE seq > ?'
+                    ' ORDER BY seq', (tier.seen,)).fetchall()
+            stale = now - tier.synced_at > self.log_retention
+            if stale:
+                tier.l1.clear()
+            if stale or rows:
+                tier.generation += 1
+            for seq, key, origin in rows:
+                tier.seen = seq
+                if origin == tier.origin:
+                    continue
+                if key == CLEAR_ALL:
+                    tier.l1.clear()
+                else:
+                    tier.l1.delete(key)
+            tier.synced_at = now
+
+    def _log(self, connection, *keys) -> None:
+        now = time.time()
+        origin = self.tier.origin
+        connection.executemany(
+            'INSERT INTO cache_log (key, origin, at) VALUES (?, ?, ?)',
+            [(key, origin, now) for key in keys],
+        )
+
+    def _cull(self, connection, changes) -> None:
+        """Удаляет старый журнал и просроченные записи. Если живых
+        записей всё ещё больше MAX_ENTRIES, удаляет каждую
+        CULL_FREQUENCY-ю долю, начиная с тех, что истекают раньше;
+        бессрочные — в последнюю очередь. Проверка идёт не на каждой
+        записи, поэтому L2 может ненадолго превысить предел.
+        """
+        now = time.time()
+        connection.execute(
+            'DELETE FROM cache_log WHERE at < ?', (now - self.log_retention,))
+        connection.execute(
+            'DELETE FROM cache_entry WHERE expires <= ?', (now,))
+        count = connection.execute(
+            'SELECT COUNT(*) FROM cache_entry').fetchone()[0]
+        if count <= self._max_entries:
+            return
+        if self._cull_frequency == 0:
+            connection.execute('DELETE FROM cache_entry')
+            changes.clear()
+            changes[CLEAR_ALL] = None
+            return
+        culled = [row[0] for row in connection.execute(
+            'SELECT key FROM cache_entry'
+            ' ORDER BY expires IS NULL, expires LIMIT ?',
+            (count // self._cull_frequency,))]
+        connection.executemany(
+            'DELETE FROM cache_entry WHERE key = ?',
+            [(key,) for key in culled])
+        for key in culled:
+            changes[key] = None
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _read(self, connection, key):
+        return connection.execute(
+            'SELECT value, expires FROM cache_entry WHERE key = ?'
+            ' AND (expires IS NULL OR expires > ?)',
+            (key, time.time())).fetchone()
+
+    def _read_many(self, keys) -> dict:
+        """Читает ключи из L2 и кладёт найденное в L1, если с начала
+        чтения L1 не менялся.
+        """
+        tier = self.tier
+        generation = tier.generation
+        with self._connection() as connection:
+            found = {}
+            for key in keys:
+                row = self._read(connection, key)
+                if row is not None:
+                    found[key] = (bytes(row[0]), row[1])
+        with tier.lock:
+            if tier.generation == generation:
+                for key, entry in found.items():
+                    tier.l1.set(key, *entry)
+        return found
+
+    def _write(self, connection, changes, key, pickled, expires) -> None:
+        connection.execute(
+            'INSERT OR REPLACE INTO cache_entry (key, value, expires)'
+            ' VALUES (?, ?, ?)', (key, pickled, expires))
+        changes[key] = (pickled, expires)
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        self._sync()
+        entry = self.l1.get(key)
+        if entry is None:
+            entry = self._read_many([key]).get(key)
+        if entry is None:
+            return default
+        return pickle.loads(entry[0])
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        self._sync()
+        found = {}
+        missing = []
+        for key, original in keys.items():
+            entry = self.l1.get(key)
+            if entry is None:
+                missing.append(key)
+            else:
+                found[original] = pickle.loads(entry[0])
+        if missing:
+            for key, entry in self._read_many(missing).items():
+                found[keys[key]] = pickle.loads(entry[0])
+        return found
+
+    def has_key(self, key, version=None):
+        return self.get(key, _MISSING, version) is not _MISSING
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self.get_backend_timeout(timeout)
+        entries = [
+            (self._key(key, version),
+             pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+            for key, value in data.items()
+        ]
+        with self._writing() as (connection, changes):
+            for key, pickled in entries:
+                self._write(connection, changes, key, pickled, expires)
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        expires = self.get_backend_timeout(timeout)
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._writing() as (connection, changes):
+            cursor = connection.execute(
+                'INSERT INTO cache_entry (key, value, expires)'
+                ' VALUES (?, ?, ?) ON CONFLICT (key) DO UPDATE'
+                ' SET value = excluded.value, expires = excluded.expires'
+                ' WHERE cache_entry.expires <= ?',
+                (key, pickled, expires, time.time()))
+            if not cursor.rowcount:
+                return False
+            changes[key] = (pickled, expires)
+        return True
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        expires = self.get_backend_timeout(timeout)
+        with self._writing() as (connection, changes):
+            row = self._read(connection, key)
+            if row is None:
+                return False
+            self._write(connection, changes, key, bytes(row[0]), expires)
+        return True
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        with self._writing() as (connection, changes):
+            row = self._read(connection, key)
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = pickle.loads(row[0]) + delta
+            self._write(
+                connection, changes, key,
+                pickle.dumps(value, pickle.HIGHEST_PROTOCOL), row[1])
+        return value
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version)
+
+    def delete_many(self, keys, version=None):
+        keys = [self._key(key, version) for key in keys]
+        with self._writing() as (connection, changes):
+            connection.executemany(
+                'DELETE FROM cache_entry WHERE key = ?',
+                [(key,) for key in keys])
+            changes.update(dict.fromkeys(keys))
+
+    def clear(self):
+        with self._writing() as (connection, changes):
+            connection.execute('DELETE FROM cache_entry')
+            changes[CLEAR_ALL] = None
+
+    def entry_count(self) -> int:
+        """Число живых записей в L2.
+        """
+        with self._connection() as connection:
+            return connection.execute(
+                'SELECT COUNT(*) FROM cache_entry'
+                ' WHERE expires IS NULL OR expires > ?',
+                (time.time(),)).fetchone()[0]
+
+    def close(self, **kwargs):
+        # Соединение с файлом живёт весь срок потока, как и L1
+        pass
+
+
+class _Transaction:
+    """Читающая транзакция L2: читающие не блокируют друг друга
+    и пишущих.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute('BEGIN')
+        return self.connection
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.connection.execute('COMMIT' if exc_type is None else 'ROLLBACK')
+
+
+_MISSING = object()
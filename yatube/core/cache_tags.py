@@ -0,0 +1,172 @@
+"""Теги кеша: запись кеша помнит версии своих тегов на момент
+сохранения и считается устаревшей, как только версия любого из них
+сменилась. Инвалидация тега — это запись новой версии, поэтому
+не нужно помнить и перебирать ключи помеченных записей.
+
+Версия начинается с метки времени в миллисекундах, так что по версиям
+можно узнать, когда страница менялась в последний раз.
+"""
+import time
+from datetime import datetime, timezone
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.middleware.cache import CacheMiddleware
+from django.utils.cache import get_cache_key, patch_cache_control
+from django.utils.decorators import decorator_from_middleware_with_args
+
+from core import stampede
+
+TAG_KEY_PREFIX = 'cache-tag:'
+
+
+def _tag_key(tag: str) -> str:
+    return f'{TAG_KEY_PREFIX}{tag}'
+
+
+def _new_version() -> str:
+    return f'{int(time.time() * 1000)}-{uuid4().hex[:12]}'
+
+
+def changed_at(versions: dict):
+    """Момент последней инвалидации среди тегов (datetime в UTC).
+    """
+    if not versions:
+        return None
+    stamps = [int(version.split('-', 1)[0]) for version in versions.values()]
+    return datetime.fromtimestamp(max(stamps) / 1000, tz=timezone.utc)
+
+
+def tag_versions(tags) -> dict:
+    """Текущие версии тегов; отсутствующим тегам выдаётся новая версия.
+    """
+    keys = {_tag_key(tag): tag for tag in tags}
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    for key in missing:
+        cache.add(key, _new_version(), None)
+    if missing:
+        found.update(cache.get_many(missing))
+    return {keys[key]: version for key, version in found.items()}
+
+
+def is_fresh(versions: dict) -> bool:
+    """Совпадают ли сохранённые версии тегов с текущими.
+    """
+    if not versions:
+        return True
+    current = cache.get_many([_tag_key(tag) for tag in versions])
+    return all(
+        current.get(_tag_key(tag)) == version
+        for tag, version in versions.items()
+    )
+
+
+def invalidate(*tags) -> None:
+    """Делает устаревшими все записи, помеченные любым из тегов.
+    """
+    if tags:
+        cache.set_many(
+            {_tag_key(tag): _new_version() for tag in tags}, None)
+
+
+def tag_request(request, *tags) -> None:
+    """Помечает тегами ответ, который будет сохранён в кеш.
+    Версии снимаются в момент вызова, поэтому view вызывает
+    её до чтения данных, из которых строится страница.
+    """
+    versions = getattr(request, '_cache_tag_versions', {})
+    versions.update(tag_versions(tags))
+    request._cache_tag_versions = versions
+
+
+def request_versions(request, tags):
+    """Версии tags, снятые tag_request до чтения данных запроса, или
+    None, если какой-то из тегов запрос не помечал.
+    """
+    captured = getattr(request, '_cache_tag_versions', {})
+    if not all(tag in captured for tag in tags):
+        return None
+    return {tag: captured[tag] for tag in tags}
+
+
+class TaggedCacheMiddleware(CacheMiddleware):
+    """CacheMiddleware, который хранит вместе с ответом версии его тегов
+    и не отдаёт из кеша ответ, чьи теги с тех пор инвалидированы.
+    Теги всегда живут в кеше default.
+
+    Срок жизни в кеше сервера долгий, поэтому клиентам отдаётся
+    max-age=0: браузер переспрашивает страницу с валидаторами.
+
+    Устаревшую страницу пересчитывает один запрос, остальные до конца
+    пересчёта получают старую копию (см. core.stampede).
+    """
+    stats_name = 'page'
+
+    def __init__(self, get_response=None, tags=(), **kwargs):
+        super().__init__(get_response, **kwargs)
+        self.tags = tags
+        self.fresh_timeout = self.cache_timeout
+        self.cache_timeout = stampede.physical_timeout(self.cache_timeout)
+
+    def process_request(self, request):
+        request._cache_started = time.monotonic()
+        response = super().process_request(request)
+        if response is None:
+            return None
+        state = stampede.freshness(
+            getattr(response, '_cache_fresh_until', None),
+            getattr(response, '_cache_compute_time', 0),
+            is_fresh(getattr(response, '_cache_tag_versions', None)),
+        )
+        if state == 'fresh':
+            return self.revalidate_on_client(response)
+        lock = get_cache_key(request, self.key_prefix, 'GET', cache=self.cache)
+        if stampede.acquire(lock):
+            stampede.record(
+                self.stats_name, 'early' if state == 'early' else 'recompute')
+            request._cache_update_cache = True
+            request._recompute_lock = lock
+            return None
+        if state == 'early':
+            return self.revalidate_on_client(response)
+        stampede.record(self.stats_name, 'collapsed')
+        # Старую копию нельзя сохранять в браузере под новым ETag
+        patch_cache_control(response, no_store=True)
+        return self.revalidate_on_client(response)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if self.tags:
+            tag_request(request, *self.tags)
+
+    def process_response(self, request, response):
+        versions = getattr(request, '_cache_tag_versions', None)
+        if versions:
+            response._cache_tag_versions = versions
+        response._cache_fresh_until = time.time() + self.fresh_timeout
+        response._cache_compute_time = time.monotonic() - getattr(
+            request, '_cache_started', time.monotonic())
+        response = super().process_response(request, response)
+        lock = getattr(request, '_recompute_lock', None)
+        if lock is not None:
+            stampede.release(lock)
+        return self.revalidate_on_client(response)
+
+    @staticmethod
+    def revalidate_on_client(response):
+        if 'Expires' in response:
+            del response['Expires']
+        patch_cache_control(
+            response, max_age=0, must_revalidate=True, private=True)
+        return response
+
+
+def cache_page_tagged(timeout, *tags, key_prefix=None):
+    """Аналог cache_page с тегами. Постоянные теги передаются
+    аргументами, зависящие от данных view добавляет через tag_request.
+    """
+    return decorator_from_middleware_with_args(TaggedCacheMiddleware)(
+        cache_timeout=timeout,
+        tags=tags,
+        key_prefix=key_prefix,
+    )
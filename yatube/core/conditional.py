@@ -0,0 +1,39 @@
+import hashlib
+
+from django.conf import settings
+from django.views.decorators.http import condition
+
+from core.cache_tags import changed_at, tag_versions
+
+
+def condition_on_tags(tags_func):
+    """Условный GET по тегам страницы. tags_func(request, **kwargs)
+    возвращает теги страницы или None, если объекта нет.
+
+    ETag — хеш версий тегов и того, кто смотрит страницу (пользователь
+    и CSRF-cookie), Last-Modified — время последней инвалидации тегов.
+    Оба считаются по кешу без обращения к шаблону, поэтому 304
+    отдаётся до рендера.
+    """
+    def versions(request, *args, **kwargs):
+        if not hasattr(request, '_condition_versions'):
+            tags = tags_func(request, *args, **kwargs)
+            request._condition_versions = (
+                None if tags is None else tag_versions(tags))
+        return request._condition_versions
+
+    def etag(request, *args, **kwargs):
+        current = versions(request, *args, **kwargs)
+        if current is None:
+            return None
+        viewer = (
+            request.user.pk,
+            request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''),
+        )
+        raw = repr((sorted(current.items()), viewer)).encode()
+        return hashlib.md5(raw).hexdigest()
+
+    def last_modified(request, *args, **kwargs):
+        return changed_at(versions(request, *args, **kwargs))
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
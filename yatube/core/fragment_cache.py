@@ -0,0 +1,101 @@
+"""Кеш фрагментов шаблона, который сам различает варианты: курсор
+страницы, язык и то, как фрагмент видит пользователь. Записи помечены
+тегами из core.cache_tags, попадания и промахи считаются по имени
+фрагмента в памяти процесса (core.stampede.count). Устаревший
+фрагмент пересчитывает один запрос, остальные отдают старую копию
+(core.stampede).
+"""
+import hashlib
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import translation
+
+from core import stampede
+from core.cache_tags import is_fresh
+
+logger = logging.getLogger(__name__)
+
+# Параметры запроса, задающие страницу ленты
+CURSOR_PARAMS = ('page', 'after', 'before')
+
+
+def viewer_variant(user, page_obj=None) -> str:
+    """Как пользователь видит фрагмент: аноним, авторизованный,
+    или автор хотя бы одного поста на странице — только ему
+    показываются кнопки редактирования.
+    """
+    if user is None or not user.is_authenticated:
+        return 'anon'
+    if page_obj is not None and any(
+            getattr(obj, 'author_id', None) == user.pk for obj in page_obj):
+        return f'owner:{user.pk}'
+    return 'auth'
+
+
+def fragment_key(name: str, request=None, page_obj=None) -> str:
+    """Ключ фрагмента с учётом курсора, языка и варианта пользователя.
+    """
+    parts = [translation.get_language() or '']
+    if request is not None:
+        parts.extend(
+            f'{param}={request.GET.get(param, "")}'
+            for param in CURSOR_PARAMS
+        )
+    user = getattr(request, 'user', None)
+    parts.append(viewer_variant(user, page_obj))
+    digest = hashlib.md5('|'.join(parts).encode()).hexdigest()
+    return f'fragment:{name}:{digest}'
+
+
+def _record(name: str, outcome: str) -> None:
+    stampede.count(f'fragment-stats:{name}:{outcome}')
+    logger.debug('fragment %s: %s', name, outcome)
+
+
+def get_fragment(name: str, key: str):
+    """Содержимое фрагмента или None, если фрагмент надо отрисовать.
+    Устаревший фрагмент отдаётся, пока его пересчитывает другой запрос.
+    """
+    entry = cache.get(key)
+    if entry is None:
+        _record(name, 'miss')
+        return None
+    versions, content, fresh_until, compute_time = entry
+    state = stampede.freshness(
+        fresh_until, compute_time, is_fresh(versions))
+    if state == 'fresh':
+        _record(name, 'hit')
+        return content
+    if stampede.acquire(key):
+        stampede.record(
+            f'fragment:{name}', 'early' if state == 'early' else 'recompute')
+        _record(name, 'miss')
+        return None
+    if state == 'stale':
+        stampede.record(f'fragment:{name}', 'collapsed')
+    _record(name, 'hit')
+    return content
+
+
+def set_fragment(key: str, content: str, versions: dict,
+                 timeout=None, compute_time=0) -> None:
+    if timeout is None:
+        timeout = settings.PAGE_CACHE_TIMEOUT
+    entry = (versions, content, time.time() + timeout, compute_time)
+    cache.set(key, entry, stampede.physical_timeout(timeout))
+    stampede.release(key)
+
+
+def fragment_stats(name: str) -> dict:
+    """Счётчики попаданий и промахов фрагмента.
+    """
+    stampede.flush()
+    keys = {
+        outcome: f'fragment-stats:{name}:{outcome}'
+        for outcome in ('hit', 'miss')
+    }
+    found = cache.get_many(keys.values())
+    return {outcome: found.get(key, 0) for outcome, key in keys.items()}
@@ -0,0 +1,187 @@
+"""Отдача MEDIA_ROOT, когда DEBUG выключен.
+
+В DEBUG медиа отдаёт static() из urls.py. Без DEBUG файлы отдаёт
+MediaMiddleware — раньше сессий, аутентификации и кеша страниц — со
+строгим ETag, 304 и запросами Range. Само содержимое не проходит
+через буферы Python:
+
+* MEDIA_SENDFILE = 'x-accel-redirect' (nginx) или 'x-sendfile'
+  (Apache, lighttpd) — Django отвечает только заголовками, а файл
+  и Range отдаёт веб-сервер;
+* иначе — FileResponse, который WSGI-сервер с wsgi.file_wrapper
+  (gunicorn, uWSGI) отправляет через os.sendfile. Так уходит только
+  файл целиком: uWSGI отправляет дескриптор с нулевого смещения
+  и во всю длину файла, поэтому ответ на Range читается блоками
+  через BoundedFile без fileno().
+"""
+import mimetypes
+import os
+import re
+import stat
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed, SuspiciousFileOperation
+from django.http import (
+    FileResponse, Http404, HttpResponse, HttpResponseNotFound,
+)
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_etags
+from django.views.decorators.http import require_safe
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# Диапазон, который нельзя отдать: ответ 416
+UNSATISFIABLE = object()
+
+
+def media_path(path: str) -> str:
+    """Полный путь файла внутри MEDIA_ROOT; скрытые файлы, например
+    недописанные загрузки хранилища, не отдаются.
+    """
+    if any(part.startswith('.') for part in path.split('/')):
+        raise Http404
+    try:
+        return safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+
+
+def file_etag(stat_result) -> str:
+    """Строгий ETag из времени изменения и размера файла.
+    """
+    return f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+
+
+def requested_range(request, etag: str, size: int):
+    """(начало, конец) включительно из заголовка Range, None для всего
+    файла или UNSATISFIABLE. Несколько диапазонов сразу
+    не поддерживаются, и на них отдаётся весь файл, как разрешает RFC 7233.
+    """
+    header = request.META.get('HTTP_RANGE', '')
+    match = RANGE_RE.match(header.strip())
+    if not match or size == 0:
+        return None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range is not None and etag not in parse_etags(if_range):
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        # bytes=-N — последние N байт
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return UNSATISFIABLE
+    return start, end
+
+
+class BoundedFile:
+    """Открытый файл, из которого можно прочитать не больше length байт
+    с текущей позиции. fileno() нет, чтобы wsgi.file_wrapper сервера
+    не отправил через sendfile весь файл вместо диапазона.
+    """
+
+    def __init__(self, file, length: int):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1) -> bytes:
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class WholeFile(BoundedFile):
+    """Файл целиком, с начала: его сервер может отправить через
+    os.sendfile по дескриптору.
+    """
+
+    def fileno(self) -> int:
+        return self.file.fileno()
+
+
+def offloaded(full_path: str, path: str) -> HttpResponse:
+    """Пустой ответ, содержимое которого подставит веб-сервер.
+    """
+    response = HttpResponse()
+    if settings.MEDIA_SENDFILE == 'x-accel-redirect':
+        response['X-Accel-Redirect'] = (
+            settings.MEDIA_ACCEL_PREFIX + quote(path))
+    else:
+        response['X-Sendfile'] = full_path
+    return response
+
+
+@require_safe
+def serve(request, path: str) -> HttpResponse:
+    """Файл MEDIA_ROOT с валидаторами и поддержкой Range.
+    """
+    full_path = media_path(path)
+    try:
+        stat_result = os.stat(full_path)
+    except OSError:
+        raise Http404
+    if not stat.S_ISREG(stat_result.st_mode):
+        raise Http404
+    size = stat_result.st_size
+    etag = file_etag(stat_result)
+    last_modified = int(stat_result.st_mtime)
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified)
+    if response is None and settings.MEDIA_SENDFILE:
+        response = offloaded(full_path, path)
+    elif response is None:
+        byte_range = requested_range(request, etag, size)
+        if byte_range is UNSATISFIABLE:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+        start, end = byte_range or (0, size - 1)
+        content_type, encoding = mimetypes.guess_type(full_path)
+        file = open(full_path, 'rb')
+        file.seek(start)
+        wrapper = WholeFile if byte_range is None else BoundedFile
+        response = FileResponse(
+            wrapper(file, end - start + 1),
+            content_type=content_type or 'application/octet-stream')
+        response['Content-Length'] = end - start + 1
+        if byte_range is not None:
+            response.status_code = 206
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(
+        response, public=True, max_age=settings.MEDIA_MAX_AGE)
+    return response
+
+
+class MediaMiddleware:
+    """Отдаёт MEDIA_URL, не пропуская запрос через остальные
+    middleware. В DEBUG не подключается.
+    """
+
+    def __init__(self, get_response):
+        if settings.DEBUG or not settings.MEDIA_URL.startswith('/'):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.prefix = settings.MEDIA_URL
+
+    def __call__(self, request):
+        if not request.path_info.startswith(self.prefix):
+            return self.get_response(request)
+        try:
+            return serve(request, request.path_info[len(self.prefix):])
+        except Http404:
+            # Без шаблона 404: у медиа его никто не увидит
+            return HttpResponseNotFound()
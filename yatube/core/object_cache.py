@@ -0,0 +1,48 @@
+"""Кеш небольших объектов, которые ищутся по уникальному полю
+(группа по slug, пользователь по username). Отсутствие объекта тоже
+кешируется, чтобы повторные 404 не ходили в базу. Записи сбрасываются
+сигналами сохранения и удаления через forget().
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404
+
+# Значение в кеше для объекта, которого нет в базе
+ABSENT = 'absent'
+
+
+def object_key(model, field: str, value) -> str:
+    return f'object:{model._meta.label_lower}:{field}:{value}'
+
+
+def cached_object(model, field: str, value):
+    """Объект model с field=value или None; читает через кеш.
+    """
+    key = object_key(model, field, value)
+    obj = cache.get(key)
+    if obj is None:
+        obj = model._default_manager.filter(**{field: value}).first()
+        if obj is None:
+            cache.set(key, ABSENT, settings.OBJECT_CACHE_MISS_TIMEOUT)
+        else:
+            cache.set(key, obj, settings.OBJECT_CACHE_TIMEOUT)
+    return None if obj == ABSENT else obj
+
+
+def get_cached_or_404(model, field: str, value):
+    """Аналог get_object_or_404 для поиска через кеш.
+    """
+    obj = cached_object(model, field, value)
+    if obj is None:
+        raise Http404(
+            f'{model._meta.object_name} с {field}={value} не найден.')
+    return obj
+
+
+def forget(model, field: str, *values) -> None:
+    """Сбрасывает записи model для перечисленных значений поля.
+    """
+    cache.delete_many([
+        object_key(model, field, value)
+        for value in values if value is not None
+    ])
@@ -0,0 +1,115 @@
+"""Сессии в кеше с отложенной записью в базу (SESSION_ENGINE).
+
+Чтение — как у cached_db: из кеша, а при промахе из базы. Создание,
+смена ключа, удаление и любое изменение того, кто вошёл (вход
+и выход), пишутся в базу сразу, чтобы не ломать их семантику.
+Остальные изменения сессии сразу попадают в кеш, а в базу уходят
+пачкой не чаще раза в SESSION_WRITE_BEHIND_INTERVAL секунд: в конце
+запроса, при следующем сохранении или при завершении процесса. Пока изменение
+не записано, кеш остаётся главным источником.
+
+Удаление сессии (выход, смена ключа) оставляет в кеше метку. Отложенная
+запись проверяет её после записи в кеш и, если сессию удалили, убирает
+запись и бросает UpdateError, как cached_db: параллельный запрос
+не вернёт вышедшему пользователю сессию.
+"""
+import atexit
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.sessions.backends.base import UpdateError
+from django.contrib.sessions.backends.cached_db import (
+    SessionStore as CachedDBStore,
+)
+from django.core.signals import request_finished
+from django.db import transaction
+
+# Отложенные изменения процесса: ключ сессии -> (данные, срок)
+_pending = {}
+_pending_lock = threading.Lock()
+_flushed_at = time.monotonic()
+
+
+class SessionStore(CachedDBStore):
+    _saved_auth = (None, None)
+
+    def _auth_state(self, data):
+        return data.get(SESSION_KEY), data.get(HASH_SESSION_KEY)
+
+    def load(self):
+        data = super().load()
+        self._saved_auth = self._auth_state(data)
+        return data
+
+    def save(self, must_create=False):
+        auth_state = self._auth_state(self._get_session())
+        if (must_create or self.session_key is None
+                or auth_state != self._saved_auth):
+            super().save(must_create)
+            self._saved_auth = auth_state
+            return
+        session = self.create_model_instance(self._get_session())
+        self._cache.set(self.cache_key, self._session, self.get_expiry_age())
+        # Метку ставят до удаления записи из кеша, поэтому либо её
+        # видно здесь, либо удаление пришло после нашей записи
+        if self._cache.get(self.deleted_key(self.session_key)) is not None:
+            self._cache.delete(self.cache_key)
+            raise UpdateError
+        with _pending_lock:
+            _pending[session.session_key] = (
+                session.session_data, session.expire_date)
+        flush_pending()
+
+    @classmethod
+    def deleted_key(cls, session_key: str) -> str:
+        return f'{cls.cache_key_prefix}deleted:{session_key}'
+
+    def delete(self, session_key=None):
+        key = session_key or self.session_key
+        if key is None:
+            return
+        self._cache.set(
+            self.deleted_key(key), True, settings.SESSION_COOKIE_AGE)
+        with _pending_lock:
+            _pending.pop(key, None)
+        super().delete(session_key)
+
+
+def flush_pending(force=False) -> int:
+    """Записывает отложенные изменения сессий в базу, если с прошлой
+    записи прошло SESSION_WRITE_BEHIND_INTERVAL секунд (или force).
+    Удалённые тем временем сессии не воскрешаются: только UPDATE.
+    """
+    global _flushed_at
+    now = time.monotonic()
+    interval = settings.SESSION_WRITE_BEHIND_INTERVAL
+    with _pending_lock:
+        if not _pending or (not force and now - _flushed_at < interval):
+            return 0
+        batch = dict(_pending)
+        _pending.clear()
+        _flushed_at = now
+    model = SessionStore.get_model_class()
+    with transaction.atomic():
+        for session_key, (session_data, expire_date) in batch.items():
+            model.objects.filter(session_key=session_key).update(
+                session_data=session_data, expire_date=expire_date)
+    return len(batch)
+
+
+def _flush_on_request_finished(**kwargs):
+    flush_pending()
+
+
+def _flush_on_exit():
+    try:
+        flush_pending(force=True)
+    except Exception:
+        # База может быть уже недоступна; в кеше данные остались
+        pass
+
+
+request_finished.connect(_flush_on_request_finished)
+atexit.register(_flush_on_exit)
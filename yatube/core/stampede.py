@@ -0,0 +1,108 @@
+"""Защита от лавины пересчётов. Когда запись кеша устарела, её
+пересчитывает только тот, кто первым взял блокировку, а остальные
+ещё немного отдают старую копию. Незадолго до истечения срока
+запись с некоторой вероятностью пересчитывается заранее
+(вероятностное раннее обновление, XFetch): чем дольше пересчёт
+и чем ближе срок, тем вероятнее.
+
+Счётчики статистики копятся в памяти процесса и переносятся в кеш
+не чаще раза в STATS_FLUSH_INTERVAL секунд: попадание в кеш остаётся
+чтением и не становится записью в общий для процессов кеш.
+"""
+import math
+import random
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+
+LOCK_KEY_PREFIX = 'recompute-lock:'
+OUTCOMES = ('recompute', 'early', 'collapsed')
+
+# Чем больше, тем раньше начинается досрочный пересчёт
+EARLY_REFRESH_BETA = 1.0
+# Как часто (в секундах) счётчики процесса переносятся в кеш
+STATS_FLUSH_INTERVAL = 10
+
+_counts = Counter()
+_counts_lock = threading.Lock()
+_flushed_at = time.monotonic()
+
+
+def acquire(key: str) -> bool:
+    """Берёт блокировку пересчёта записи; False, если её уже держат.
+    """
+    return cache.add(
+        f'{LOCK_KEY_PREFIX}{key}', 1, settings.CACHE_RECOMPUTE_LOCK_TIMEOUT)
+
+
+def release(key: str) -> None:
+    cache.delete(f'{LOCK_KEY_PREFIX}{key}')
+
+
+def physical_timeout(timeout: int) -> int:
+    """Срок хранения записи: её срок свежести и время, пока можно
+    отдавать устаревшую копию.
+    """
+    return timeout + settings.CACHE_STALE_TIMEOUT
+
+
+def freshness(fresh_until, compute_time, tags_fresh=True) -> str:
+    """'fresh', 'early' (пора пересчитать досрочно) или 'stale'.
+    """
+    if not tags_fresh:
+        return 'stale'
+    if fresh_until is None:
+        return 'fresh'
+    now = time.time()
+    if now >= fresh_until:
+        return 'stale'
+    gap = -compute_time * EARLY_REFRESH_BETA * math.log(
+        1.0 - random.random())
+    return 'early' if now + gap >= fresh_until else 'fresh'
+
+
+def count(key: str) -> None:
+    """Увеличивает счётчик статистики в памяти процесса; в кеш
+    он попадёт при очередном flush.
+    """
+    with _counts_lock:
+        _counts[key] += 1
+        due = time.monotonic() - _flushed_at >= STATS_FLUSH_INTERVAL
+    if due:
+        flush()
+
+
+def flush() -> None:
+    """Переносит накопленные счётчики процесса в бессрочные
+    счётчики в кеше.
+    """
+    global _flushed_at
+    with _counts_lock:
+        pending = dict(_counts)
+        _counts.clear()
+        _flushed_at = time.monotonic()
+    for key, delta in pending.items():
+        if not cache.add(key, delta, None):
+            try:
+                cache.incr(key, delta)
+            except ValueError:
+                cache.add(key, delta, None)
+
+
+def record(name: str, outcome: str) -> None:
+    count(f'stampede-stats:{name}:{outcome}')
+
+
+def stampede_stats(name: str) -> dict:
+    """Сколько раз запись пересчитали после устаревания, досрочно,
+    и сколько пересчётов схлопнулось в отдачу старой копии.
+    """
+    flush()
+    keys = {
+        outcome: f'stampede-stats:{name}:{outcome}' for outcome in OUTCOMES
+    }
+    found = cache.get_many(keys.values())
+    return {outcome: found.get(key, 0) for outcome, key in keys.items()}
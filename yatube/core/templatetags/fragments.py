@@ -0,0 +1,56 @@
+import time
+
+from django import template
+
+from core.cache_tags import request_versions
+from core.fragment_cache import fragment_key, get_fragment, set_fragment
+
+register = template.Library()
+
+
+class FragmentCacheNode(template.Node):
+    def __init__(self, nodelist, name, tags):
+        self.nodelist = nodelist
+        self.name = name
+        self.tags = tags
+
+    def render(self, context):
+        # Версии нужны снятые до того, как view прочитал данные: иначе
+        # старый фрагмент сохранится под версией, которую уже сменил
+        # пост, записанный между запросом к базе и отрисовкой
+        request = context.get('request')
+        versions = request_versions(
+            request, [tag.resolve(context) for tag in self.tags])
+        if versions is None:
+            return self.nodelist.render(context)
+        name = self.name.resolve(context)
+        key = fragment_key(name, request, context.get('page_obj'))
+        content = get_fragment(name, key)
+        if content is None:
+            started = time.monotonic()
+            content = self.nodelist.render(context)
+            set_fragment(key, content, versions,
+                         compute_time=time.monotonic() - started)
+        return content
+
+
+@register.tag('fragment_cache')
+def do_fragment_cache(parser, token):
+    """{% fragment_cache 'имя' 'тег' ... %} ... {% endfragment_cache %}
+
+    Кеширует фрагмент отдельно для каждой страницы ленты, языка
+    и варианта пользователя; записи помечаются перечисленными тегами.
+    Теги должен пометить view (tag_request или cache_page_tagged)
+    до чтения данных; иначе фрагмент отрисовывается без кеша.
+    """
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError(
+            f'{bits[0]} ожидает как минимум имя фрагмента.')
+    nodelist = parser.parse(('endfragment_cache',))
+    parser.delete_first_token()
+    return FragmentCacheNode(
+        nodelist,
+        parser.compile_filter(bits[1]),
+        [parser.compile_filter(bit) for bit in bits[2:]],
+    )
@@ -0,0 +1,38 @@
+"""Запуск тестов с кешем во временном каталоге.
+"""
+import os
+import tempfile
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+from core.cache_backends import TieredCache
+
+TIERED_CACHE = f'{TieredCache.__module__}.{TieredCache.__name__}'
+
+
+class TempCacheRunner(DiscoverRunner):
+    """Переносит L2 каждого TieredCache во временный каталог, чтобы
+    тесты не читали и не портили cache.sqlite3 работающего сайта.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        self.cache_directory = tempfile.TemporaryDirectory()
+        self.cache_settings = override_settings(CACHES={
+            alias: self.temp_location(alias, config)
+            for alias, config in settings.CACHES.items()
+        })
+        self.cache_settings.enable()
+        super().setup_test_environment(**kwargs)
+
+    def teardown_test_environment(self, **kwargs):
+        super().teardown_test_environment(**kwargs)
+        self.cache_settings.disable()
+        self.cache_directory.cleanup()
+
+    def temp_location(self, alias, config):
+        if config['BACKEND'] != TIERED_CACHE:
+            return config
+        location = os.path.join(self.cache_directory.name, f'{alias}.sqlite3')
+        return {**config, 'LOCATION': location}
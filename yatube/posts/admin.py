@@ -1,6 +1,7 @@
 from django.contrib import admin
 
 from posts.models import Post, Group, Comment, Follow
+from posts.search import fts_available, match_expression, matching_ids
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -16,6 +17,15 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        """Поиск по индексу FTS5 вместо LIKE '%...%' по всей таблице.
+        """
+        match = match_expression(search_term)
+        if not match or not fts_available():
+            return super().get_search_results(
+                request, queryset, search_term)
+        return queryset.filter(pk__in=matching_ids(match)), False
+
 
 class GroupAdmin(admin.ModelAdmin):
     list_display = (
@@ -0,0 +1,222 @@
+"""Автодополнение имён пользователей и групп.
+
+Индекс живёт в памяти процесса: отсортированный список записей
+(ключ, вид, id, значение, подпись), где ключ — username, slug
+или название группы в casefold. Префиксный поиск — bisect до начала
+диапазона и проход по нему, пока набрано limit объектов, без
+обращений к базе.
+
+Сигналы правят индекс своего процесса на месте (insort и удаление
+по bisect), увеличивают счётчик версии в общем кеше и кладут правку
+(вид, id, записи) в журнал под ключом её версии. Процесс, чья версия
+отстала, при следующем поиске применяет недостающие правки из журнала
+тем же replace, без базы. Из базы, двумя запросами, индекс
+перестраивается, только если в журнале пропуск или отставание больше
+MAX_CATCH_UP. Начальное значение счётчика случайное, чтобы после
+очистки кеша версии процессов не совпали со старой случайно.
+"""
+import random
+import threading
+from bisect import bisect_left, insort
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+
+from posts.models import Group
+
+User = get_user_model()
+
+VERSION_KEY = 'autocomplete:version'
+CHANGE_KEY = 'autocomplete:change:{}'
+# Сколько секунд правка хранится в журнале
+CHANGE_TIMEOUT = 60 * 60
+# На сколько правок процесс может отстать, чтобы догнать их по журналу
+MAX_CATCH_UP = 100
+# Поля, от которых зависят записи индекса
+USER_FIELDS = {'username', 'first_name', 'last_name'}
+GROUP_FIELDS = {'slug', 'title'}
+# Длиннее username и slug не бывают; остальное отрезается
+MAX_PREFIX = 150
+
+
+def normalize(value: str) -> str:
+    return value.strip().casefold()[:MAX_PREFIX]
+
+
+def user_entries(pk: int, username: str, first_name: str,
+                 last_name: str) -> list:
+    label = f'{first_name} {last_name}'.strip() or username
+    return [(normalize(username), 'user', pk, username, label)]
+
+
+def group_entries(pk: int, slug: str, title: str) -> list:
+    keys = {normalize(slug), normalize(title)}
+    return [(key, 'group', pk, slug, title) for key in sorted(keys)]
+
+
+class PrefixIndex:
+    """Отсортированный массив записей с поиском по префиксу ключа.
+    """
+
+    def __init__(self, entries=()):
+        self.entries = sorted(entries)
+        self.objects = {}
+        for entry in self.entries:
+            self.objects.setdefault(entry[1:3], []).append(entry)
+
+    def __len__(self):
+        return len(self.objects)
+
+    def add(self, entries: list) -> None:
+        for entry in entries:
+            insort(self.entries, entry)
+            self.objects.setdefault(entry[1:3], []).append(entry)
+
+    def remove(self, kind: str, pk: int) -> None:
+        for entry in self.objects.pop((kind, pk), ()):
+            index = bisect_left(self.entries, entry)
+            if index < len(self.entries) and self.entries[index] == entry:
+                del self.entries[index]
+
+    def replace(self, kind: str, pk: int, entries: list) -> None:
+        self.remove(kind, pk)
+        self.add(entries)
+
+    def search(self, prefix: str, limit: int) -> list:
+        """До limit разных объектов, у которых ключ начинается
+        с prefix, по алфавиту ключей: (вид, значение, подпись).
+        """
+        prefix = normalize(prefix)
+        if not prefix or limit <= 0:
+            return []
+        found = []
+        seen = set()
+        # Проход по индексу, а не по срезу: срез копировал бы весь хвост
+        index = bisect_left(self.entries, (prefix,))
+        while index < len(self.entries):
+            key, kind, pk, value, label = self.entries[index]
+            index += 1
+            if not key.startswith(prefix):
+                break
+            if (kind, pk) in seen:
+                continue
+            seen.add((kind, pk))
+            found.append((kind, value, label))
+            if len(found) == limit:
+                break
+        return found
+
+
+_lock = threading.Lock()
+_index = None
+_version = None
+
+
+def build() -> PrefixIndex:
+    entries = []
+    users = User.objects.values_list(
+        'pk', 'username', 'first_name', 'last_name')
+    for row in users.iterator():
+        entries.extend(user_entries(*row))
+    for row in Group.objects.values_list('pk', 'slug', 'title').iterator():
+        entries.extend(group_entries(*row))
+    return PrefixIndex(entries)
+
+
+def current_version() -> int:
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, random.getrandbits(62), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def catch_up(index: PrefixIndex, version: int, target: int) -> bool:
+    """Применяет к index правки журнала после version до target
+    включительно. False и index без изменений, если отставание
+    слишком велико или какой-то правки в журнале уже нет.
+    """
+    if not 0 <= target - version <= MAX_CATCH_UP:
+        return False
+    keys = [CHANGE_KEY.format(v) for v in range(version + 1, target + 1)]
+    changes = cache.get_many(keys)
+    if len(changes) != len(keys):
+        return False
+    for key in keys:
+        index.replace(*changes[key])
+    return True
+
+
+def get_index() -> PrefixIndex:
+    """Индекс процесса, догнавший версию в кеше. Перестройка идёт
+    без блокировки, чтобы поиск в других потоках не ждал базу;
+    правки, сделанные во время неё, применятся из журнала.
+    """
+    global _index, _version
+    version = current_version()
+    with _lock:
+        if _index is not None and _version is not None:
+            if _version == version or catch_up(_index, _version, version):
+                _version = version
+                return _index
+    index = build()
+    with _lock:
+        _index, _version = index, version
+    return index
+
+
+def suggest(prefix: str, limit: int) -> list:
+    return get_index().search(prefix, limit)
+
+
+def _changed(kind: str, pk: int, entries: list) -> None:
+    """Пишет правку в журнал под новой версией и применяет её
+    к индексу процесса, догнав сначала правки других процессов.
+    Если догнать не удалось, индекс перестроится при следующем поиске.
+    """
+    global _version
+    try:
+        version = cache.incr(VERSION_KEY)
+    except ValueError:
+        version = None
+    if version is not None:
+        cache.set(
+            CHANGE_KEY.format(version), (kind, pk, entries), CHANGE_TIMEOUT)
+    with _lock:
+        if _index is None or version is None or _version is None:
+            _version = None
+        elif _version >= version:
+            # Другой поток уже применил эту правку из журнала
+            pass
+        elif catch_up(_index, _version, version - 1):
+            _index.replace(kind, pk, entries)
+            _version = version
+        else:
+            _version = None
+
+
+def relevant(fields: set, update_fields) -> bool:
+    """Затрагивает ли сохранение поля индекса: вход пользователя
+    сохраняет только last_login.
+    """
+    return update_fields is None or bool(fields & set(update_fields))
+
+
+def user_saved(user, update_fields=None) -> None:
+    if relevant(USER_FIELDS, update_fields):
+        _changed('user', user.pk, user_entries(
+            user.pk, user.username, user.first_name, user.last_name))
+
+
+def group_saved(group, update_fields=None) -> None:
+    if relevant(GROUP_FIELDS, update_fields):
+        _changed('group', group.pk, group_entries(
+            group.pk, group.slug, group.title))
+
+
+def user_deleted(pk: int) -> None:
+    _changed('user', pk, [])
+
+
+def group_deleted(pk: int) -> None:
+    _changed('group', pk, [])
@@ -0,0 +1,66 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+from posts.models import Group, MediaBlob, Profile
+
+
+def shifted(field: str, delta: int):
+    """Выражение F(field) + delta, не уходящее ниже нуля.
+    """
+    if delta < 0:
+        return Greatest(F(field) + delta, 0)
+    return F(field) + delta
+
+
+def bump_profile(user_id: int, field: str, delta: int) -> None:
+    """Атомарно сдвигает счётчик профиля выражением F().
+    Профиль создаётся при первом увеличении, если его ещё нет.
+    """
+    profiles = Profile.objects.filter(user_id=user_id)
+    if profiles.update(**{field: shifted(field, delta)}) or delta < 0:
+        return
+    Profile.objects.get_or_create(user_id=user_id)
+    profiles.update(**{field: shifted(field, delta)})
+
+
+def bump_group(group_id: int, delta: int) -> None:
+    """Атомарно сдвигает счётчик постов группы.
+    """
+    if group_id is not None:
+        Group.objects.filter(pk=group_id).update(
+            post_count=shifted('post_count', delta))
+
+
+def acquire_blob(name: str) -> None:
+    """Добавляет ссылку на файл хранилища картинок.
+    """
+    if not name:
+        return
+    blobs = MediaBlob.objects.filter(name=name)
+    if blobs.update(ref_count=shifted('ref_count', 1)):
+        return
+    MediaBlob.objects.get_or_create(name=name)
+    blobs.update(ref_count=shifted('ref_count', 1))
+
+
+def release_blob(name: str) -> bool:
+    """Убирает ссылку на файл; True, если ссылок больше нет и файл
+    можно удалять. Файлы без учёта ссылок не удаляются никогда.
+    """
+    if not name:
+        return False
+    with transaction.atomic():
+        blobs = MediaBlob.objects.filter(name=name)
+        blobs.update(ref_count=shifted('ref_count', -1))
+        deleted, _ = blobs.filter(ref_count=0).delete()
+    return bool(deleted)
+
+
+def author_post_count(user) -> int:
+    """Число постов автора из денормализованного счётчика.
+    """
+    try:
+        return user.profile.post_count
+    except Profile.DoesNotExist:
+        return 0
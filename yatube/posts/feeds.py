@@ -0,0 +1,177 @@
+from operator import attrgetter
+
+from django.conf import settings
+
+from posts.models import FeedEntry, Follow, Post, Profile
+
+# Размер пачки при массовой вставке записей ленты
+BATCH_SIZE = 500
+
+
+def is_pulled(author_id: int) -> bool:
+    """Посты автора, переведённого на подтягивание, не раскладываются
+    по лентам, а подтягиваются при чтении.
+    """
+    return Profile.objects.filter(
+        user_id=author_id, feed_pulled=True).exists()
+
+
+def resume_threshold() -> int:
+    """Сколько подписчиков должно остаться у автора, чтобы его посты
+    снова раскладывались по лентам.
+    """
+    return int(
+        settings.FEED_FANOUT_THRESHOLD * settings.FEED_FANOUT_HYSTERESIS)
+
+
+def feed_entries(user_ids, author_id: int, posts: list):
+    for user_id in user_ids:
+        for post_id, pub_date in posts:
+            yield FeedEntry(
+                user_id=user_id,
+                post_id=post_id,
+                author_id=author_id,
+                pub_date=pub_date,
+            )
+
+
+def insert(rows) -> None:
+    FeedEntry.objects.bulk_create(
+        rows, batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+
+def pk_chunks(queryset, chunk_size: int, *fields):
+    """Строки (pk, *fields) из queryset пачками по chunk_size
+    в порядке pk.
+    """
+    queryset = queryset.order_by('pk').values_list('pk', *fields)
+    last_pk = None
+    while True:
+        page = queryset if last_pk is None else queryset.filter(
+            pk__gt=last_pk)
+        rows = list(page[:chunk_size])
+        if not rows:
+            return
+        yield rows
+        last_pk = rows[-1][0]
+
+
+def fill(author_id: int, follows, posts, chunk_size: int) -> None:
+    """Раскладывает посты из posts в ленты подписчиков из follows:
+    одна вставка — один подписчик и chunk_size постов, чтобы
+    блокировка записи не держалась долго.
+    """
+    for post_rows in pk_chunks(posts, chunk_size, 'pub_date'):
+        for follow_rows in pk_chunks(follows, chunk_size, 'user_id'):
+            for _, user_id in follow_rows:
+                insert(feed_entries([user_id], author_id, post_rows))
+
+
+def fan_out(post: Post) -> None:
+    """Раскладывает новый пост в ленты всех подписчиков автора.
+    """
+    if is_pulled(post.author_id):
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id).values_list('user_id', flat=True)
+    insert(feed_entries(
+        followers.iterator(), post.author_id, [(post.pk, post.pub_date)]))
+
+
+def backfill(follow: Follow) -> None:
+    """Добавляет в ленту подписчика уже опубликованные посты автора.
+    """
+    if is_pulled(follow.author_id):
+        return
+    posts = Post.objects.filter(
+        author_id=follow.author_id).values_list('pk', 'pub_date')
+    insert(feed_entries([follow.user_id], follow.author_id, posts.iterator()))
+
+
+def start_pulling(author_id: int) -> None:
+    """Переводит автора на подтягивание, когда подписчиков стало
+    больше порога. Разложенные раньше записи остаются в лентах:
+    при чтении они не используются, а при возврате к раскладке
+    их не придётся вставлять заново.
+    """
+    Profile.objects.filter(
+        user_id=author_id,
+        feed_pulled=False,
+        follower_count__gt=settings.FEED_FANOUT_THRESHOLD,
+    ).update(feed_pulled=True)
+
+
+def resumable_authors() -> list:
+    """Подтягиваемые авторы, у которых подписчиков осталось не больше
+    resume_threshold(). Разрыв между порогами не даёт автору у порога
+    переключаться на каждой подписке.
+    """
+    return list(Profile.objects.filter(
+        feed_pulled=True, follower_count__lte=resume_threshold(),
+    ).values_list('user_id', flat=True))
+
+
+def resume_fan_out(author_id: int, chunk_size: int = BATCH_SIZE) -> bool:
+    """Возвращает автора к раскладке (команда resume_fan_out).
+
+    Пока автор подтягивался, его новые посты не раскладывались,
+    а новые подписчики не получили старых, поэтому ленты всех
+    подписчиков сначала дозаполняются пачками, а автор тем временем
+    остаётся на подтягивании, и лента подписок его посты не теряет.
+    Потом флаг снимается, если подписчиков всё ещё мало, и отдельно
+    раскладывается то, что появилось за время дозаполнения.
+    """
+    follows = Follow.objects.filter(author_id=author_id)
+    posts = Post.objects.filter(author_id=author_id)
+    last_follow = follows.order_by('-pk').values_list(
+        'pk', flat=True).first() or 0
+    last_post = posts.order_by('-pk').values_list(
+        'pk', flat=True).first() or 0
+    fill(author_id, follows.filter(pk__lte=last_follow),
+         posts.filter(pk__lte=last_post), chunk_size)
+    resumed = Profile.objects.filter(
+        user_id=author_id,
+        feed_pulled=True,
+        follower_count__lte=resume_threshold(),
+    ).update(feed_pulled=False)
+    if not resumed:
+        return False
+    # Дальше новые посты и подписки раскладываются сами
+    fill(author_id, follows, posts.filter(pk__gt=last_post), chunk_size)
+    fill(author_id, follows.filter(pk__gt=last_follow),
+         posts.filter(pk__lte=last_post), chunk_size)
+    return True
+
+
+def prune(follow: Follow) -> None:
+    """Убирает из ленты бывшего подписчика посты автора.
+    """
+    FeedEntry.objects.filter(
+        user_id=follow.user_id, author_id=follow.author_id).delete()
+
+
+def pulled_authors(author_ids) -> list:
+    """Те из author_ids, чьи посты подтягиваются при чтении ленты.
+    """
+    if not author_ids:
+        return []
+    return list(Profile.objects.filter(
+        user_id__in=list(author_ids), feed_pulled=True,
+    ).values_list('user_id', flat=True))
+
+
+def follow_feed(user, pulled) -> list:
+    """Источники ленты подписок для MergedCursorPaginator.
+
+    Разложенные записи читаются одним диапазоном по индексу
+    (user, pub_date, post); посты «тяжёлых» авторов из pulled —
+    отдельным потоком на автора по индексу (author, pub_date).
+    """
+    entries = FeedEntry.objects.filter(user=user).exclude(
+        author_id__in=pulled).select_related('post__author', 'post__group')
+    sources = [(entries, ('pub_date', 'post_id'), attrgetter('post'))]
+    for author_id in pulled:
+        posts = Post.objects.filter(
+            author_id=author_id).select_related('author', 'group')
+        sources.append((posts, ('pub_date', 'pk'), None))
+    return sources
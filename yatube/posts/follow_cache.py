@@ -0,0 +1,77 @@
+"""Кешированное множество авторов, на которых подписан пользователь.
+
+Хранится отсортированным массивом целых (array('l')): он компактен
+в кеше, а проверка подписки — двоичный поиск. Сигналы подписки
+и отписки правят закешированный массив на месте, а не сбрасывают его.
+"""
+from array import array
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.core.cache import cache
+
+from posts.models import Follow
+
+
+def follow_key(user_id: int) -> str:
+    return f'follows:{user_id}'
+
+
+def followed_ids(user_id: int) -> array:
+    """Отсортированные id авторов, на которых подписан пользователь.
+    """
+    key = follow_key(user_id)
+    ids = cache.get(key)
+    if ids is None:
+        ids = array('l', Follow.objects.filter(user_id=user_id).order_by(
+            'author_id').values_list('author_id', flat=True))
+        cache.set(key, ids, settings.FOLLOW_CACHE_TIMEOUT)
+    return ids
+
+
+def contains(ids: array, author_id: int) -> bool:
+    index = bisect_left(ids, author_id)
+    return index < len(ids) and ids[index] == author_id
+
+
+def is_following(user_id: int, author_id: int) -> bool:
+    return contains(followed_ids(user_id), author_id)
+
+
+def following_among(user_id: int, author_ids) -> set:
+    """Те из author_ids, на кого подписан пользователь, одним
+    чтением кеша.
+    """
+    ids = followed_ids(user_id)
+    return {author_id for author_id in author_ids if contains(ids, author_id)}
+
+
+def _update(user_id: int, author_id: int, add: bool) -> None:
+    """Правит закешированный массив, если он есть. Параллельную правку
+    того же массива не ждём: тогда запись просто сбрасывается.
+    """
+    key = follow_key(user_id)
+    lock = f'{key}:lock'
+    if not cache.add(lock, 1, settings.CACHE_RECOMPUTE_LOCK_TIMEOUT):
+        cache.delete(key)
+        return
+    try:
+        ids = cache.get(key)
+        if ids is None:
+            return
+        present = contains(ids, author_id)
+        if add and not present:
+            insort(ids, author_id)
+        elif not add and present:
+            ids.pop(bisect_left(ids, author_id))
+        cache.set(key, ids, settings.FOLLOW_CACHE_TIMEOUT)
+    finally:
+        cache.delete(lock)
+
+
+def remember_follow(user_id: int, author_id: int) -> None:
+    _update(user_id, author_id, add=True)
+
+
+def forget_follow(user_id: int, author_id: int) -> None:
+    _update(user_id, author_id, add=False)
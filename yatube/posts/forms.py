@@ -1,6 +1,9 @@
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
 
+from posts.images import ingest
 from posts.models import Post, Comment
+from posts.uploads import RejectedUpload
 
 
 class PostForm(forms.ModelForm):
@@ -10,6 +13,29 @@ class PostForm(forms.ModelForm):
         model = Post
         fields = ('text', 'group', 'image')
 
+    def clean_image(self):
+        """Новая картинка уменьшается и очищается от метаданных
+        (posts/images.py); уже сохранённая остаётся как есть.
+        """
+        image = self.cleaned_data.get('image')
+        if not isinstance(image, UploadedFile):
+            return image
+        try:
+            return ingest(image)
+        except (OSError, ValueError):
+            raise forms.ValidationError(
+                'Не удалось обработать картинку.', code='invalid_image')
+
+    def clean(self):
+        cleaned_data = super().clean()
+        image = self.files.get('image')
+        if isinstance(image, RejectedUpload):
+            # Загрузку отбросил обработчик (posts/uploads.py), и ошибка
+            # ImageField о пустом файле заменяется настоящей причиной
+            self._errors.pop('image', None)
+            self.add_error('image', image.error)
+        return cleaned_data
+
 
 class CommentForm(forms.ModelForm):
 
@@ -0,0 +1,159 @@
+"""Приём загруженных картинок постов.
+
+Оригинал уменьшается до IMAGE_MAX_SIZE по большей стороне,
+поворачивается по ориентации из EXIF и сохраняется заново без
+метаданных: на диске не лежат лишние мегапиксели, а декодирование
+при генерации миниатюр дешевле. Анимированные картинки сохраняются
+как есть — пересохранение оставило бы только первый кадр.
+
+Размеры, объём, хеш и крошечная размытая заглушка (LQIP) картинки
+хранятся в полях поста и заполняются при загрузке: шаблоны рисуют
+<img> с размерами и заглушкой, не обращаясь к хранилищу.
+"""
+import hashlib
+from base64 import b64encode
+from io import BytesIO
+
+from django.conf import settings
+from PIL import Image, ImageFilter, ImageOps
+
+from posts.uploads import StreamingUploadedFile
+
+# Что из Image.info нужно, чтобы картинка выглядела так же;
+# остальное (EXIF, XMP, комментарии, текстовые блоки PNG) отбрасывается
+KEPT_INFO = ('icc_profile', 'transparency')
+
+# Служебные поля Image.info, которые не раскрывают ничего о снимке;
+# картинку только с ними и в пределах IMAGE_MAX_SIZE незачем
+# пересохранять
+TECHNICAL_INFO = {
+    'adobe', 'adobe_transform', 'aspect', 'background', 'compression',
+    'dpi', 'duration', 'gamma', 'jfif', 'jfif_density', 'jfif_unit',
+    'jfif_version', 'loop', 'progression', 'progressive', 'srgb', 'version',
+}
+# EXIF-ориентации, при которых ширина и высота меняются местами
+ORIENTATION = 0x0112
+TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+# Поля поста с описанием картинки и их значения для поста без неё
+METADATA_FIELDS = {
+    'image_width': None,
+    'image_height': None,
+    'image_size': None,
+    'image_hash': '',
+    'image_placeholder': '',
+}
+
+
+def can_save(image_format: str) -> bool:
+    """Умеет ли установленный Pillow сохранять в формате.
+    """
+    Image.init()
+    return image_format.upper() in Image.SAVE
+
+
+def ingest(upload):
+    """Уменьшенная копия загруженной картинки без метаданных — во
+    временном файле upload_temp_dir() с посчитанным sha256. Картинка,
+    которую нечем уменьшать и нечего вычищать, возвращается как есть
+    (без потерь от пересжатия и с уже посчитанным хешем загрузки).
+    """
+    upload.seek(0)
+    image = Image.open(upload)
+    if getattr(image, 'is_animated', False):
+        upload.seek(0)
+        return upload
+    image_format = image.format
+    max_size = settings.IMAGE_MAX_SIZE
+    if (max(image.size) <= max_size
+            and set(image.info) <= TECHNICAL_INFO.union(KEPT_INFO)):
+        upload.seek(0)
+        return upload
+    info = {key: image.info[key] for key in KEPT_INFO if key in image.info}
+    # JPEG сразу декодируется в уменьшенном масштабе
+    image.draft(None, (max_size, max_size))
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((max_size, max_size), Image.LANCZOS)
+    image.info = info
+    params = dict(info)
+    if image_format in ('JPEG', 'WEBP'):
+        params['quality'] = settings.IMAGE_QUALITY
+    if image_format == 'JPEG':
+        params.update(optimize=True, progressive=True)
+    # Копия пишется на диск рядом с хранилищем, как потоковая загрузка
+    result = StreamingUploadedFile(
+        upload.name, getattr(upload, 'content_type', None), 0,
+        getattr(upload, 'charset', None))
+    try:
+        image.save(result.file, format=image_format, **params)
+        result.size = result.file.tell()
+        result.seek(0)
+        hasher = hashlib.sha256()
+        for chunk in result.chunks():
+            hasher.update(chunk)
+    except Exception:
+        result.close()
+        raise
+    result.seek(0)
+    result.sha256 = hasher.hexdigest()
+    return result
+
+
+def placeholder(image) -> str:
+    """Размытая копия картинки в IMAGE_PLACEHOLDER_SIZE пикселей
+    по большей стороне как data URI.
+    """
+    size = settings.IMAGE_PLACEHOLDER_SIZE
+    small = image.convert('RGB')
+    small.thumbnail((size, size), Image.BILINEAR)
+    small = small.filter(ImageFilter.GaussianBlur(1))
+    buffer = BytesIO()
+    small.save(buffer, format='JPEG', quality=40)
+    encoded = b64encode(buffer.getvalue()).decode()
+    return f'data:image/jpeg;base64,{encoded}'
+
+
+def image_metadata(file) -> dict:
+    """Значения METADATA_FIELDS для файла картинки.
+    """
+    # Хеш загрузки уже посчитан при приёме (posts/uploads.py)
+    digest = getattr(getattr(file, 'file', file), 'sha256', None)
+    if digest is None:
+        hasher = hashlib.sha256()
+        for chunk in file.chunks():
+            hasher.update(chunk)
+        digest = hasher.hexdigest()
+    file.seek(0)
+    image = Image.open(file)
+    width, height = image.size
+    if image.getexif().get(ORIENTATION) in TRANSPOSED_ORIENTATIONS:
+        width, height = height, width
+    size = settings.IMAGE_PLACEHOLDER_SIZE
+    image.draft(None, (size, size))
+    image = ImageOps.exif_transpose(image)
+    file.seek(0)
+    return {
+        'image_width': width,
+        'image_height': height,
+        'image_size': file.size,
+        'image_hash': digest,
+        'image_placeholder': placeholder(image),
+    }
+
+
+def fill_metadata(post, force=False) -> bool:
+    """Заполняет описание картинки поста; возвращает, изменилось ли
+    оно. Уже сохранённый файл читается из хранилища только при force.
+    """
+    if not post.image:
+        values = METADATA_FIELDS
+    elif force or not post.image._committed:
+        values = image_metadata(post.image)
+    else:
+        return False
+    changed = False
+    for field, value in values.items():
+        if getattr(post, field) != value:
+            setattr(post, field, value)
+            changed = True
+    return changed
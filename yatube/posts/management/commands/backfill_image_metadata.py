@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand
+
+from core.cache_tags import invalidate
+from posts.images import METADATA_FIELDS, fill_metadata
+from posts.models import Post
+from posts.signals import post_tags
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет размеры, объём, хеш и заглушку картинок у постов, '
+        'загруженных до появления этих полей.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=100,
+            help='Сколько постов читать из базы за раз.',
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Пересчитать и уже заполненные посты.',
+        )
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='').exclude(image=None)
+        if not options['force']:
+            posts = posts.filter(image_hash='')
+        posts = posts.select_related('group').order_by('pk')
+        filled = failed = 0
+        last_pk = 0
+        while True:
+            chunk = list(posts.filter(pk__gt=last_pk)[:options['chunk_size']])
+            if not chunk:
+                break
+            last_pk = chunk[-1].pk
+            tags = set()
+            for post in chunk:
+                try:
+                    changed = fill_metadata(post, force=True)
+                except (OSError, ValueError) as error:
+                    failed += 1
+                    self.stderr.write(
+                        f'Пост {post.pk}: не удалось прочитать '
+                        f'{post.image.name}: {error}')
+                    continue
+                finally:
+                    post.image.close()
+                if changed:
+                    # update() вместо save(): без сигналов счётчиков
+                    Post.objects.filter(pk=post.pk).update(**{
+                        field: getattr(post, field)
+                        for field in METADATA_FIELDS
+                    })
+                    tags.update(post_tags(post))
+                filled += 1
+            invalidate(*tags)
+        self.stdout.write(self.style.SUCCESS(
+            f'Заполнено постов: {filled}, с ошибками: {failed}'))
@@ -0,0 +1,160 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from core.object_cache import forget
+from posts.models import Follow, Group, MediaBlob, Post, Profile
+
+User = get_user_model()
+
+
+def actual_counts(queryset, field: str, lo: int, hi: int) -> dict:
+    """Реальные числа строк queryset по значениям field в [lo, hi).
+    """
+    rows = queryset.filter(**{f'{field}__gte': lo, f'{field}__lt': hi})
+    rows = rows.order_by().values(field).annotate(total=Count('pk'))
+    return {row[field]: row['total'] for row in rows}
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверяет денормализованные счётчики постов и подписчиков, '
+        'а также ссылки на файлы картинок с реальными данными '
+        'и исправляет расхождения пачками.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Сколько строк сверять за одну транзакцию.',
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        fixed_groups = self.reconcile_groups(chunk_size)
+        fixed_profiles = self.reconcile_profiles(chunk_size)
+        fixed_blobs = self.reconcile_blobs(chunk_size)
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено групп: {fixed_groups}, '
+            f'профилей: {fixed_profiles}, '
+            f'файлов картинок: {fixed_blobs}'
+        ))
+
+    @staticmethod
+    def chunks(queryset, chunk_size: int):
+        """Диапазоны первичных ключей [lo, hi) по chunk_size строк.
+        """
+        lo = 0
+        while True:
+            pks = list(queryset.filter(pk__gte=lo).order_by(
+                'pk').values_list('pk', flat=True)[:chunk_size])
+            if not pks:
+                return
+            hi = pks[-1] + 1
+            yield lo, hi
+            lo = hi
+
+    def reconcile_groups(self, chunk_size: int) -> int:
+        fixed = 0
+        for lo, hi in self.chunks(Group.objects.all(), chunk_size):
+            with transaction.atomic():
+                actual = actual_counts(Post.objects, 'group_id', lo, hi)
+                groups = Group.objects.select_for_update().filter(
+                    pk__gte=lo, pk__lt=hi,
+                ).values_list('pk', 'post_count', 'slug')
+                for pk, post_count, slug in groups:
+                    if actual.get(pk, 0) != post_count:
+                        Group.objects.filter(pk=pk).update(
+                            post_count=actual.get(pk, 0))
+                        forget(Group, 'slug', slug)
+                        fixed += 1
+        return fixed
+
+    def reconcile_profiles(self, chunk_size: int) -> int:
+        fixed = 0
+        for lo, hi in self.chunks(User.objects.all(), chunk_size):
+            with transaction.atomic():
+                posts = actual_counts(Post.objects, 'author_id', lo, hi)
+                followers = actual_counts(
+                    Follow.objects, 'author_id', lo, hi)
+                stored = {
+                    user_id: (post_count, follower_count)
+                    for user_id, post_count, follower_count
+                    in Profile.objects.select_for_update().filter(
+                        user_id__gte=lo, user_id__lt=hi,
+                    ).values_list('user_id', 'post_count', 'follower_count')
+                }
+                for user_id in set(posts) | set(followers) | set(stored):
+                    expected = (
+                        posts.get(user_id, 0), followers.get(user_id, 0))
+                    if stored.get(user_id, (0, 0)) == expected:
+                        continue
+                    Profile.objects.update_or_create(
+                        user_id=user_id,
+                        defaults={
+                            'post_count': expected[0],
+                            'follower_count': expected[1],
+                        },
+                    )
+                    fixed += 1
+        return fixed
+
+    @staticmethod
+    def name_chunks(sources, chunk_size: int):
+        """Диапазоны имён (lo, hi] так, чтобы в каждом было не больше
+        chunk_size разных имён из каждого источника; у последнего
+        диапазона hi = None. sources — пары (queryset, поле имени).
+        """
+        lo = ''
+        while True:
+            bounds = []
+            exhausted = True
+            for queryset, field in sources:
+                names = list(
+                    queryset.filter(**{f'{field}__gt': lo})
+                    .order_by(field).values_list(field, flat=True)
+                    .distinct()[:chunk_size])
+                if len(names) == chunk_size:
+                    bounds.append(names[-1])
+                if names:
+                    exhausted = False
+            if exhausted:
+                return
+            hi = min(bounds) if bounds else None
+            yield lo, hi
+            if hi is None:
+                return
+            lo = hi
+
+    def reconcile_blobs(self, chunk_size: int) -> int:
+        """Пересчитывает ссылки постов на файлы картинок, в том числе
+        на загруженные до учёта ссылок. Сами файлы не удаляются.
+        """
+        fixed = 0
+        posts = Post.objects.exclude(image='').exclude(image=None)
+        sources = ((posts, 'image'), (MediaBlob.objects.all(), 'name'))
+        for lo, hi in self.name_chunks(sources, chunk_size):
+            images = posts.filter(image__gt=lo)
+            blobs = MediaBlob.objects.filter(name__gt=lo)
+            if hi is not None:
+                images = images.filter(image__lte=hi)
+                blobs = blobs.filter(name__lte=hi)
+            with transaction.atomic():
+                actual = dict(images.order_by().values_list(
+                    'image').annotate(total=Count('pk')))
+                stored = dict(blobs.select_for_update().values_list(
+                    'name', 'ref_count'))
+                for name in set(actual) | set(stored):
+                    expected = actual.get(name, 0)
+                    if stored.get(name) == expected:
+                        continue
+                    if expected:
+                        MediaBlob.objects.update_or_create(
+                            name=name, defaults={'ref_count': expected})
+                    else:
+                        MediaBlob.objects.filter(name=name).delete()
+                    fixed += 1
+        return fixed
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from posts.feeds import BATCH_SIZE, resumable_authors, resume_fan_out
+
+
+class Command(BaseCommand):
+    help = (
+        'Возвращает к раскладке по лентам авторов, у которых подписчиков '
+        'стало меньше порога: дозаполняет ленты подписчиков пачками '
+        'и только потом снимает подтягивание.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Сколько постов и подписчиков читать из базы за раз.',
+        )
+
+    def handle(self, *args, **options):
+        resumed = 0
+        for author_id in resumable_authors():
+            if resume_fan_out(author_id, options['chunk_size']):
+                resumed += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Возвращено к раскладке авторов: {resumed}'))
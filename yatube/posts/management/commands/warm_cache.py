@@ -0,0 +1,142 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import Client
+from django.urls import reverse
+
+from posts.models import Group, Post, Profile
+from posts.paginators import CursorPaginator
+
+
+def cache_entries():
+    """Число записей в кеше default, если бэкенд умеет его назвать.
+    """
+    if hasattr(cache, 'entry_count'):
+        return cache.entry_count()
+    if hasattr(cache, '_cache'):
+        return len(cache._cache)
+    return None
+
+
+def default_host() -> str:
+    """Первый конкретный адрес из ALLOWED_HOSTS: ключ кеша страницы
+    содержит хост, поэтому прогревать надо тот, что видят посетители.
+    """
+    for host in settings.ALLOWED_HOSTS:
+        if host != '*' and not host.startswith('.'):
+            return host
+    return 'localhost'
+
+
+class Command(BaseCommand):
+    help = (
+        'Прогревает кеш после деплоя: первые страницы главной, '
+        'самые наполненные группы и профили с наибольшим числом '
+        'подписчиков запрашиваются через настоящие view.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--pages', type=int, default=3,
+            help='Сколько первых страниц главной прогреть.')
+        parser.add_argument(
+            '--groups', type=int, default=10,
+            help='Сколько групп с наибольшим числом постов прогреть.')
+        parser.add_argument(
+            '--profiles', type=int, default=10,
+            help='Сколько профилей с наибольшим числом подписчиков '
+                 'прогреть.')
+        parser.add_argument(
+            '--workers', type=int, default=4,
+            help='Сколько страниц запрашивать одновременно.')
+        parser.add_argument(
+            '--host', default=None,
+            help='Хост сайта, для которого прогреваются страницы '
+                 '(по умолчанию первый адрес из ALLOWED_HOSTS).')
+        parser.add_argument(
+            '--https', action='store_true',
+            help='Прогревать страницы, запрошенные по HTTPS.')
+
+    def handle(self, *args, **options):
+        self.host = options['host'] or default_host()
+        self.secure = options['https']
+        addresses = (
+            self.index_addresses(options['pages'])
+            + self.group_addresses(options['groups'])
+            + self.profile_addresses(options['profiles'])
+        )
+        before = cache_entries()
+        started = time.monotonic()
+        if options['workers'] > 1:
+            with ThreadPoolExecutor(options['workers']) as pool:
+                results = list(pool.map(self.fetch_in_thread, addresses))
+        else:
+            results = [self.fetch(address) for address in addresses]
+        elapsed = time.monotonic() - started
+        after = cache_entries()
+        for address, status, seconds in results:
+            if status != 200:
+                self.stderr.write(f'{address}: ответ {status}')
+            elif options['verbosity'] > 1:
+                self.stdout.write(f'{address}: {seconds:.3f} с')
+        created = '?' if None in (before, after) else after - before
+        warmed = sum(status == 200 for _, status, _ in results)
+        self.stdout.write(self.style.SUCCESS(
+            f'Прогрето страниц: {warmed} из {len(results)} '
+            f'за {elapsed:.2f} с, новых записей в кеше: {created}'
+        ))
+
+    def fetch(self, address: str):
+        """Запрашивает страницу анонимно с хостом и схемой сайта:
+        (адрес, статус, секунды).
+        """
+        started = time.monotonic()
+        response = Client().get(
+            address, HTTP_HOST=self.host, secure=self.secure)
+        return address, response.status_code, time.monotonic() - started
+
+    def fetch_in_thread(self, address: str):
+        try:
+            return self.fetch(address)
+        finally:
+            connections.close_all()
+
+    @staticmethod
+    def index_addresses(pages: int) -> list:
+        """Адреса первых страниц главной по курсорам, как их строит
+        пагинатор ленты.
+        """
+        index = reverse('posts:index')
+        addresses = []
+        cursor = None
+        for _ in range(pages):
+            addresses.append(f'{index}?after={cursor}' if cursor else index)
+            paginator = CursorPaginator(
+                Post.objects.all(), settings.MAX, after=cursor)
+            paginator.page()
+            cursor = paginator.next_cursor
+            if cursor is None:
+                break
+        return addresses
+
+    @staticmethod
+    def group_addresses(count: int) -> list:
+        slugs = Group.objects.order_by('-post_count').values_list(
+            'slug', flat=True)[:count]
+        return [
+            reverse('posts:group_list', kwargs={'slug': slug})
+            for slug in slugs
+        ]
+
+    @staticmethod
+    def profile_addresses(count: int) -> list:
+        usernames = Profile.objects.order_by('-follower_count').values_list(
+            'user__username', flat=True)[:count]
+        return [
+            reverse('posts:profile', kwargs={'username': username})
+            for username in usernames
+        ]
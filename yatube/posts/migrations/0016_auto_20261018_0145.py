@@ -0,0 +1,41 @@
+# Generated by Django 2.2.16 on 2026-10-18 01:45
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_post_counts(apps, schema_editor):
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    Group = apps.get_model('posts', 'Group')
+    Profile = apps.get_model('posts', 'Profile')
+    groups = Group.objects.annotate(posts_total=Count('posts'))
+    for group in groups.iterator():
+        Group.objects.filter(pk=group.pk).update(post_count=group.posts_total)
+    users = User.objects.annotate(posts_total=Count('posts'))
+    for user in users.filter(posts_total__gt=0).iterator():
+        Profile.objects.update_or_create(
+            user_id=user.pk, defaults={'post_count': user.posts_total})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0015_profile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='group',
+            name='post_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Постов в группе'),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='post_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Постов'),
+        ),
+        migrations.RunPython(
+            fill_post_counts, migrations.RunPython.noop
+        ),
+    ]
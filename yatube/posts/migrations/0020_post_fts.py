@@ -0,0 +1,79 @@
+from django.db import migrations
+
+# Полнотекстовый индекс FTS5 по тексту поста и названию и описанию
+# его группы; rowid совпадает с id поста (posts/search.py)
+CREATE = (
+    "CREATE VIRTUAL TABLE posts_post_fts USING fts5("
+    " text, group_title, group_description,"
+    " tokenize = 'unicode61', prefix = '2 3')",
+
+    "INSERT INTO posts_post_fts"
+    " (rowid, text, group_title, group_description)"
+    " SELECT p.id, p.text, g.title, g.description"
+    " FROM posts_post p LEFT JOIN posts_group g ON g.id = p.group_id",
+
+    "CREATE TRIGGER posts_post_fts_insert AFTER INSERT ON posts_post"
+    " BEGIN"
+    "  INSERT INTO posts_post_fts"
+    "  (rowid, text, group_title, group_description)"
+    "  SELECT new.id, new.text, g.title, g.description"
+    "  FROM (SELECT 1) LEFT JOIN posts_group g ON g.id = new.group_id;"
+    " END",
+
+    "CREATE TRIGGER posts_post_fts_update"
+    " AFTER UPDATE OF text, group_id ON posts_post"
+    " WHEN old.text IS NOT new.text OR old.group_id IS NOT new.group_id"
+    " BEGIN"
+    "  DELETE FROM posts_post_fts WHERE rowid = old.id;"
+    "  INSERT INTO posts_post_fts"
+    "  (rowid, text, group_title, group_description)"
+    "  SELECT new.id, new.text, g.title, g.description"
+    "  FROM (SELECT 1) LEFT JOIN posts_group g ON g.id = new.group_id;"
+    " END",
+
+    "CREATE TRIGGER posts_post_fts_delete AFTER DELETE ON posts_post"
+    " BEGIN"
+    "  DELETE FROM posts_post_fts WHERE rowid = old.id;"
+    " END",
+
+    "CREATE TRIGGER posts_group_fts_update"
+    " AFTER UPDATE OF title, description ON posts_group"
+    " WHEN old.title IS NOT new.title"
+    " OR old.description IS NOT new.description"
+    " BEGIN"
+    "  UPDATE posts_post_fts"
+    "  SET group_title = new.title, group_description = new.description"
+    "  WHERE rowid IN (SELECT id FROM posts_post WHERE group_id = new.id);"
+    " END",
+)
+
+DROP = (
+    'DROP TRIGGER IF EXISTS posts_group_fts_update',
+    'DROP TRIGGER IF EXISTS posts_post_fts_delete',
+    'DROP TRIGGER IF EXISTS posts_post_fts_update',
+    'DROP TRIGGER IF EXISTS posts_post_fts_insert',
+    'DROP TABLE IF EXISTS posts_post_fts',
+)
+
+
+def run(statements):
+    """Выполняет statements только на SQLite: на других базах поиск
+    обходится без FTS5.
+    """
+    def operation(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0019_auto_20261018_0216'),
+    ]
+
+    operations = [
+        migrations.RunPython(run(CREATE), run(DROP)),
+    ]
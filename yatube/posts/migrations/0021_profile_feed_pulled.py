@@ -0,0 +1,27 @@
+# Generated by Django 2.2.16 on 2026-10-18 02:54
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def mark_pulled(apps, schema_editor):
+    Profile = apps.get_model('posts', 'Profile')
+    Profile.objects.filter(
+        follower_count__gt=settings.FEED_FANOUT_THRESHOLD,
+    ).update(feed_pulled=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0020_post_fts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='feed_pulled',
+            field=models.BooleanField(default=False, verbose_name='Лента подтягивается при чтении'),
+        ),
+        migrations.RunPython(mark_pulled, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,8 @@
 from django.db import models
 from django.contrib.auth import get_user_model
 
+from posts.storage import ContentAddressedStorage
+
 User = get_user_model()
 
 
@@ -31,14 +33,66 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=ContentAddressedStorage(),
         blank=True,
         null=True
     )
+    # Заполняются при загрузке (posts/images.py), чтобы шаблонам
+    # не нужно было открывать файл картинки
+    image_width = models.PositiveIntegerField(
+        'Ширина картинки',
+        blank=True,
+        null=True,
+        editable=False,
+    )
+    image_height = models.PositiveIntegerField(
+        'Высота картинки',
+        blank=True,
+        null=True,
+        editable=False,
+    )
+    image_size = models.PositiveIntegerField(
+        'Размер картинки в байтах',
+        blank=True,
+        null=True,
+        editable=False,
+    )
+    image_hash = models.CharField(
+        'SHA-256 картинки',
+        max_length=64,
+        blank=True,
+        editable=False,
+    )
+    image_placeholder = models.TextField(
+        'Размытая заглушка картинки',
+        blank=True,
+        editable=False,
+    )
 
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='post_pub_date_idx',
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='post_author_pub_date_idx',
+            ),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='post_group_pub_date_idx',
+            ),
+            # Сверка ссылок на файлы картинок идёт диапазонами имён
+            # (reconcile_counters)
+            models.Index(
+                fields=['image'],
+                name='post_image_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.text[:15]
@@ -53,6 +107,11 @@ class Group(models.Model):
         unique=True,
     )
     description = models.TextField()
+    post_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Постов в группе',
+    )
 
     def __str__(self):
         return self.title
@@ -87,6 +146,12 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ('-created',)
+        indexes = [
+            models.Index(
+                fields=['post', '-created', '-id'],
+                name='comment_post_created_idx',
+            ),
+        ]
 
 
 class Follow(models.Model):
@@ -112,3 +177,110 @@ class Follow(models.Model):
                 name='unique_follower'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['user', 'author'],
+                name='follow_user_author_idx',
+            ),
+        ]
+
+
+class FeedEntry(models.Model):
+    """Запись материализованной ленты подписок: пост автора,
+    разложенный в ленту каждого подписчика при публикации.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Подписчик',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Пост',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор',
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации',
+    )
+
+    class Meta:
+        ordering = ('-pub_date', '-post_id')
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                name='unique_feed_entry'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='feed_user_pub_date_idx',
+            ),
+            models.Index(
+                fields=['user', 'author'],
+                name='feed_user_author_idx',
+            ),
+        ]
+
+
+class Profile(models.Model):
+    """Денормализованные счётчики пользователя.
+    """
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        related_name='profile',
+        verbose_name='Пользователь',
+    )
+    follower_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Подписчиков',
+    )
+    post_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Постов',
+    )
+    # Посты автора не раскладываются по лентам подписчиков,
+    # а подтягиваются при чтении (posts/feeds.py)
+    feed_pulled = models.BooleanField(
+        default=False,
+        verbose_name='Лента подтягивается при чтении',
+    )
+
+    class Meta:
+        verbose_name = 'Профиль'
+        verbose_name_plural = 'Профили'
+
+    def __str__(self):
+        return str(self.user)
+
+
+class MediaBlob(models.Model):
+    """Файл хранилища картинок и число постов, которые на него ссылаются.
+    """
+    name = models.CharField(
+        max_length=100,
+        unique=True,
+        verbose_name='Имя файла',
+    )
+    ref_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Ссылок',
+    )
+
+    class Meta:
+        verbose_name = 'Файл картинки'
+        verbose_name_plural = 'Файлы картинок'
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,113 @@
+"""Полнотекстовый поиск по постам.
+
+На SQLite поиск идёт по таблице FTS5 posts_post_fts (миграция
+0020_post_fts): в ней текст поста, название и описание его группы,
+а триггеры обновляют её вместе с posts_post и posts_group. Выдача
+упорядочена по bm25 и листается курсором по ключу (релевантность,
+id), так что ни одна страница не просматривает таблицу постов.
+На других базах остаётся поиск по вхождению в текст.
+"""
+import base64
+import binascii
+import math
+import re
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+from posts.paginators import CursorPaginator, parse_pk
+
+FTS_TABLE = 'posts_post_fts'
+# Веса колонок в bm25: текст поста, название группы, описание группы
+WEIGHTS = (1.0, 0.5, 0.2)
+SCORE = f'bm25({FTS_TABLE}, {", ".join(map(str, WEIGHTS))})'
+# Сколько слов запроса учитывается
+MAX_TERMS = 10
+
+
+def fts_available() -> bool:
+    return connection.vendor == 'sqlite'
+
+
+def match_expression(query: str) -> str:
+    """Запрос FTS5 из пользовательского ввода: каждое слово ищется
+    как префикс (так находятся и другие его формы), все слова должны
+    встретиться. Операторы и кавычки FTS5 из ввода не попадают.
+    """
+    terms = re.findall(r'\w+', query.lower())[:MAX_TERMS]
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def matching_ids(match: str) -> RawSQL:
+    """Подзапрос id постов, подходящих под выражение FTS5.
+    """
+    return RawSQL(
+        f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+        (match,))
+
+
+def ranked_ids(match: str, cursor, newer: bool, limit: int) -> list:
+    """[(id, релевантность)] за курсором: по убыванию релевантности
+    (возрастанию bm25), для newer — в обратную сторону.
+    """
+    sql = (f'SELECT rowid, {SCORE} FROM {FTS_TABLE}'
+           f' WHERE {FTS_TABLE} MATCH %s')
+    params = [match]
+    if cursor is not None:
+        score, pk = cursor
+        op = '<' if newer else '>'
+        sql += f' AND ({SCORE} {op} %s OR ({SCORE} = %s AND rowid {op} %s))'
+        params += [score, score, pk]
+    direction = 'DESC' if newer else 'ASC'
+    sql += f' ORDER BY {SCORE} {direction}, rowid {direction} LIMIT %s'
+    params.append(limit)
+    with connection.cursor() as db_cursor:
+        db_cursor.execute(sql, params)
+        return db_cursor.fetchall()
+
+
+def encode_score_cursor(score: float, pk: int) -> str:
+    raw = f'{score!r}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_score_cursor(token: str):
+    if not token:
+        return None
+    try:
+        padding = '=' * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(token + padding).decode()
+        score, pk = raw.rsplit('|', 1)
+        score = float(score)
+        if not math.isfinite(score):
+            return None
+        return score, parse_pk(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+class SearchPaginator(CursorPaginator):
+    """Курсорная пагинация выдачи FTS5. object_list — queryset,
+    из которого по найденным id достаются посты.
+    """
+    decode = staticmethod(decode_score_cursor)
+
+    def __init__(self, queryset, per_page, match, after=None, before=None,
+                 query=''):
+        super().__init__(queryset, per_page, after=after, before=before)
+        self.match = match
+        self.query = query
+
+    def fetch(self, cursor, newer, limit):
+        ranked = ranked_ids(self.match, cursor, newer, limit)
+        posts = self.object_list.in_bulk([pk for pk, _ in ranked])
+        rows = []
+        for pk, score in ranked:
+            post = posts.get(pk)
+            if post is not None:
+                post.score = score
+                rows.append(post)
+        return rows
+
+    def _cursor_for(self, obj):
+        return encode_score_cursor(obj.score, obj.pk)
@@ -0,0 +1,239 @@
+import logging
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import SuspiciousFileOperation
+from django.db import transaction
+from django.db.models.signals import (
+    post_delete, post_save, pre_delete, pre_save,
+)
+from django.dispatch import receiver
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+
+from core.cache_tags import invalidate
+from core.object_cache import forget
+from posts import autocomplete, feeds
+from posts.counters import (
+    acquire_blob, bump_group, bump_profile, release_blob,
+)
+from posts.follow_cache import forget_follow, remember_follow
+from posts.images import fill_metadata
+from posts.models import Comment, Follow, Group, MediaBlob, Post
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+# Поля, которые шаблоны показывают на чужих страницах; первое —
+# поле поиска объекта по адресу
+GROUP_SHOWN_FIELDS = ('slug', 'title')
+USER_SHOWN_FIELDS = ('username', 'first_name', 'last_name')
+
+
+def group_slug(post: Post):
+    return post.group.slug if post.group_id is not None else None
+
+
+def post_tags(post: Post) -> list:
+    """Теги страниц, на которых виден пост.
+    """
+    tags = ['feed:index', f'post:{post.pk}', f'author:{post.author_id}']
+    if post.group_id is not None:
+        tags.append(f'group:{group_slug(post)}')
+    return tags
+
+
+def delete_image(name: str) -> None:
+    """Удаляет файл картинки и его миниатюры, если на файл снова
+    не сослались.
+    """
+    if MediaBlob.objects.filter(name=name).exists():
+        return
+    storage = Post._meta.get_field('image').storage
+    try:
+        default.kvstore.delete(ImageFile(name, storage))
+        storage.delete(name)
+    except (OSError, SuspiciousFileOperation):
+        logger.warning('Не удалось удалить картинку %s', name, exc_info=True)
+
+
+def release_image(name: str) -> None:
+    """Снимает ссылку поста на файл картинки; последний файл удаляется
+    после фиксации транзакции.
+    """
+    if release_blob(name):
+        transaction.on_commit(lambda: delete_image(name))
+
+
+@receiver(pre_save, sender=Post)
+def post_saving(sender, instance, **kwargs):
+    fill_metadata(instance)
+    instance._old_group = (None, None)
+    instance._old_image = None
+    if instance.pk is not None:
+        old = Post.objects.filter(pk=instance.pk).values_list(
+            'group_id', 'group__slug', 'image').first()
+        if old is not None:
+            instance._old_group = old[:2]
+            instance._old_image = old[2]
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    old_group_id, old_group_slug = instance._old_group or (None, None)
+    tags = post_tags(instance)
+    image = instance.image.name or ''
+    if created:
+        acquire_blob(image)
+    elif (instance._old_image or '') != image:
+        acquire_blob(image)
+        release_image(instance._old_image)
+    if created:
+        bump_profile(instance.author_id, 'post_count', 1)
+        bump_group(instance.group_id, 1)
+        feeds.fan_out(instance)
+        forget(Group, 'slug', group_slug(instance))
+    elif old_group_id != instance.group_id:
+        bump_group(old_group_id, -1)
+        bump_group(instance.group_id, 1)
+        forget(Group, 'slug', old_group_slug, group_slug(instance))
+        if old_group_slug is not None:
+            tags.append(f'group:{old_group_slug}')
+    invalidate(*tags)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    bump_profile(instance.author_id, 'post_count', -1)
+    bump_group(instance.group_id, -1)
+    forget(Group, 'slug', group_slug(instance))
+    release_image(instance.image.name)
+    invalidate(*post_tags(instance))
+
+
+@receiver([post_save, post_delete], sender=Comment)
+def comment_changed(sender, instance, **kwargs):
+    invalidate(f'post:{instance.post_id}')
+
+
+def remember_lookup(model, fields, instance, update_fields) -> None:
+    """Запоминает прежние значения полей, если они могут смениться
+    при сохранении: первое — поле поиска, чтобы сбросить и старую
+    запись кеша, все вместе — чтобы понять, что поменялось на страницах.
+    """
+    instance._old_lookup = None
+    instance._old_shown = None
+    if instance.pk is not None and (
+            update_fields is None or set(fields) & set(update_fields)):
+        old = model.objects.filter(pk=instance.pk).values_list(
+            *fields).first()
+        if old is not None:
+            instance._old_lookup = old[0]
+            instance._old_shown = old
+
+
+def shown_changed(instance, fields) -> bool:
+    old = getattr(instance, '_old_shown', None)
+    return old is not None and old != tuple(
+        getattr(instance, field) for field in fields)
+
+
+def author_tags(**post_filter) -> list:
+    """Теги страниц авторов отобранных постов: их профили, посты
+    и ленты подписчиков показывают группу поста.
+    """
+    author_ids = Post.objects.filter(**post_filter).order_by().values_list(
+        'author_id', flat=True).distinct()
+    return [f'author:{author_id}' for author_id in author_ids]
+
+
+def user_page_tags(user) -> list:
+    """Теги страниц, где видно имя пользователя: его посты в лентах
+    и группах и его комментарии под чужими постами.
+    """
+    tags = ['feed:index', f'author:{user.pk}']
+    comments = Comment.objects.filter(author_id=user.pk).order_by()
+    post_ids = comments.values_list('post_id', flat=True).distinct()
+    tags.extend(f'post:{post_id}' for post_id in post_ids)
+    posts = Post.objects.filter(
+        author_id=user.pk, group__isnull=False).order_by()
+    slugs = posts.values_list('group__slug', flat=True).distinct()
+    tags.extend(f'group:{slug}' for slug in slugs)
+    return tags
+
+
+@receiver(pre_save, sender=Group)
+def group_saving(sender, instance, update_fields=None, **kwargs):
+    remember_lookup(Group, GROUP_SHOWN_FIELDS, instance, update_fields)
+
+
+@receiver(pre_delete, sender=Group)
+def group_deleting(sender, instance, **kwargs):
+    # После удаления у постов уже не будет group_id
+    instance._author_tags = author_tags(group_id=instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Group)
+def group_changed(sender, instance, **kwargs):
+    old_slug = getattr(instance, '_old_lookup', None)
+    forget(Group, 'slug', instance.slug, old_slug)
+    tags = ['feed:index', f'group:{instance.slug}']
+    if old_slug not in (None, instance.slug):
+        tags.append(f'group:{old_slug}')
+    if hasattr(instance, '_author_tags'):
+        tags.extend(instance._author_tags)
+    elif shown_changed(instance, GROUP_SHOWN_FIELDS):
+        tags.extend(author_tags(group_id=instance.pk))
+    invalidate(*tags)
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, update_fields=None, **kwargs):
+    autocomplete.group_saved(instance, update_fields)
+
+
+@receiver(post_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    autocomplete.group_deleted(instance.pk)
+
+
+@receiver(pre_save, sender=User)
+def user_saving(sender, instance, update_fields=None, **kwargs):
+    remember_lookup(User, USER_SHOWN_FIELDS, instance, update_fields)
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, **kwargs):
+    forget(User, 'username', instance.username,
+           getattr(instance, '_old_lookup', None))
+    forget(User, 'pk', instance.pk)
+    if shown_changed(instance, USER_SHOWN_FIELDS):
+        invalidate(*user_page_tags(instance))
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, update_fields=None, **kwargs):
+    autocomplete.user_saved(instance, update_fields)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    autocomplete.user_deleted(instance.pk)
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, **kwargs):
+    if created:
+        bump_profile(instance.author_id, 'follower_count', 1)
+        feeds.start_pulling(instance.author_id)
+        feeds.backfill(instance)
+        remember_follow(instance.user_id, instance.author_id)
+    invalidate(f'follow:{instance.user_id}', f'author:{instance.author_id}')
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    bump_profile(instance.author_id, 'follower_count', -1)
+    feeds.prune(instance)
+    forget_follow(instance.user_id, instance.author_id)
+    invalidate(f'follow:{instance.user_id}', f'author:{instance.author_id}')
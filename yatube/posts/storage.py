@@ -0,0 +1,95 @@
+"""Хранилище картинок постов, адресуемое содержимым.
+
+Файл называется по SHA-256 своего содержимого:
+<каталог upload_to>/<первые два символа хеша>/<хеш><расширение>.
+Одинаковые загрузки хранятся один раз и делят миниатюры sorl, ключ
+которых строится из имени исходника. Сколько постов ссылается на
+файл, считает MediaBlob (posts/counters.py); файл удаляется, когда
+ссылок не осталось (posts/signals.py). Загрузку, которая уже лежит
+во временном файле на той же файловой системе, хранилище просто
+переименовывает.
+"""
+import hashlib
+import os
+import posixpath
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+# Временные файлы создаются с правами 0600; без FILE_UPLOAD_PERMISSIONS
+# готовый файл получает права по umask, как у FileSystemStorage
+_umask = os.umask(0)
+os.umask(_umask)
+DEFAULT_FILE_MODE = 0o666 & ~_umask
+
+
+def content_name(name: str, digest: str) -> str:
+    """Имя файла по хешу содержимого с каталогом и расширением name.
+    """
+    directory = posixpath.dirname(name)
+    extension = posixpath.splitext(name)[1].lower()
+    return posixpath.join(directory, digest[:2], f'{digest}{extension}')
+
+
+def content_digest(content) -> str:
+    """SHA-256 содержимого; у загрузки он уже посчитан при приёме
+    (posts/uploads.py).
+    """
+    digest = getattr(content, 'sha256', None)
+    if digest is None:
+        hasher = hashlib.sha256()
+        for chunk in content.chunks():
+            hasher.update(chunk)
+        digest = hasher.hexdigest()
+    return digest
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage, который сохраняет одинаковое содержимое
+    в один файл.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # Имя задаёт содержимое, поэтому занятое имя — тот же файл
+        return name
+
+    def _save(self, name, content):
+        name = content_name(name, content_digest(content))
+        if self.exists(name):
+            return name
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        if self.directory_permissions_mode is not None:
+            os.chmod(directory, self.directory_permissions_mode)
+        if hasattr(content, 'temporary_file_path'):
+            try:
+                self._move(content.temporary_file_path(), full_path)
+            except OSError:
+                # Временный файл на другой файловой системе
+                pass
+            else:
+                # Иначе файл закроет сборщик мусора и попробует удалить
+                # уже перенесённое
+                content.close()
+                return name
+        # Пишем во временный файл и атомарно переименовываем: два
+        # одновременных сохранения одного содержимого не мешают друг другу
+        fd, temporary = tempfile.mkstemp(dir=directory, prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as output:
+                for chunk in content.chunks():
+                    output.write(chunk)
+            self._move(temporary, full_path)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+        return name
+
+    def _move(self, source: str, full_path: str) -> None:
+        mode = self.file_permissions_mode
+        os.chmod(source, DEFAULT_FILE_MODE if mode is None else mode)
+        os.replace(source, full_path)
@@ -0,0 +1,149 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, SimpleTestCase, TestCase
+from django.urls import reverse
+
+from posts import autocomplete
+from posts.autocomplete import PrefixIndex, group_entries, user_entries
+from posts.models import Group
+
+User = get_user_model()
+
+AUTOCOMPLETE_URL = reverse('posts:autocomplete')
+
+
+class PrefixIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = PrefixIndex(
+            user_entries(1, 'anna', '', '')
+            + user_entries(2, 'Andrey', 'Андрей', 'Петров')
+            + user_entries(3, 'boris', '', '')
+            + group_entries(1, 'animals', 'Animals')
+            + group_entries(2, 'cats', 'Анимешные коты'))
+
+    def test_prefix_range_in_key_order(self):
+        """Совпадения идут по алфавиту ключей без учёта регистра,
+        объект с двумя совпавшими ключами попадает в выдачу один раз.
+        """
+        self.assertEqual(self.index.search('AN', 10), [
+            ('user', 'Andrey', 'Андрей Петров'),
+            ('group', 'animals', 'Animals'),
+            ('user', 'anna', 'anna'),
+        ])
+        self.assertEqual(
+            self.index.search('аним', 10),
+            [('group', 'cats', 'Анимешные коты')])
+
+    def test_limit_and_empty_prefix(self):
+        self.assertEqual(len(self.index.search('a', 2)), 2)
+        self.assertEqual(self.index.search('', 10), [])
+        self.assertEqual(self.index.search('zz', 10), [])
+
+    def test_replace_and_remove(self):
+        self.index.replace('group', 1, group_entries(1, 'zoo', 'Zoo'))
+        self.assertEqual(
+            self.index.search('an', 10),
+            [('user', 'Andrey', 'Андрей Петров'), ('user', 'anna', 'anna')])
+        self.index.remove('group', 1)
+        self.index.remove('user', 1)
+        self.assertEqual(self.index.search('zoo', 10), [])
+        self.assertEqual(len(self.index), 3)
+
+
+class AutocompleteViewTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='gardener')
+        cls.group = Group.objects.create(title='Сад и огород', slug='garden')
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def suggest(self, prefix, **params):
+        response = self.client.get(AUTOCOMPLETE_URL, {'q': prefix, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_users_and_groups(self):
+        self.assertEqual(self.suggest('GARD'), [
+            {
+                'type': 'group',
+                'value': 'garden',
+                'label': 'Сад и огород',
+                'url': reverse('posts:group_list', args=['garden']),
+            },
+            {
+                'type': 'user',
+                'value': 'gardener',
+                'label': 'gardener',
+                'url': reverse('posts:profile', args=['gardener']),
+            },
+        ])
+        self.assertEqual(
+            [result['value'] for result in self.suggest('сад')], ['garden'])
+        self.assertEqual(len(self.suggest('gard', limit=1)), 1)
+        self.assertEqual(self.suggest(''), [])
+
+    def test_warm_index_skips_database(self):
+        self.suggest('g')
+        with self.assertNumQueries(0):
+            self.suggest('ga')
+
+    def test_index_follows_changes_without_rebuild(self):
+        """Сохранение и удаление правят индекс на месте: после них
+        поиск по-прежнему не ходит в базу.
+        """
+        self.suggest('g')
+        user = User.objects.create_user(username='grower')
+        self.group.slug = 'vegetables'
+        self.group.title = 'Овощи'
+        self.group.save()
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                [result['value'] for result in self.suggest('g')],
+                ['gardener', 'grower'])
+            self.assertEqual(
+                [result['value'] for result in self.suggest('ово')],
+                ['vegetables'])
+        user.delete()
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                [result['value'] for result in self.suggest('gr')], [])
+
+    def test_login_keeps_index(self):
+        self.suggest('g')
+        self.user.set_password('password')
+        self.user.save()
+        version = cache.get(autocomplete.VERSION_KEY)
+        self.client.login(username='gardener', password='password')
+        self.assertEqual(cache.get(autocomplete.VERSION_KEY), version)
+
+    def test_other_process_change_applied_from_log(self):
+        """Правку другого процесса индекс применяет из журнала в кеше,
+        не обращаясь к базе.
+        """
+        self.suggest('g')
+        version = cache.incr(autocomplete.VERSION_KEY)
+        entries = user_entries(self.user.pk, 'planter', '', '')
+        cache.set(
+            autocomplete.CHANGE_KEY.format(version),
+            ('user', self.user.pk, entries))
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                [result['value'] for result in self.suggest('pl')],
+                ['planter'])
+            self.assertEqual(
+                [result['value'] for result in self.suggest('gard')],
+                ['garden'])
+
+    def test_gap_in_log_rebuilds(self):
+        """Если версию сдвинул другой процесс, а правки в журнале нет,
+        индекс перестраивается из базы.
+        """
+        self.suggest('g')
+        User.objects.filter(pk=self.user.pk).update(username='planter')
+        cache.incr(autocomplete.VERSION_KEY)
+        self.assertEqual(
+            [result['value'] for result in self.suggest('pl')], ['planter'])
@@ -0,0 +1,125 @@
+import os
+import tempfile
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from core.cache_backends import TieredCache
+
+
+class TieredCacheTest(SimpleTestCase):
+    """Два процесса с общим L2: у каждого свой L1, а изменения одного
+    доходят до L1 другого через журнал инвалидаций.
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'cache.sqlite3')
+        self.first = self.worker(1001)
+        self.second = self.worker(1002)
+
+    def worker(self, pid, **options):
+        options.setdefault('SYNC_INTERVAL', 0)
+        cache = TieredCache(self.path, {'OPTIONS': options})
+        return cache, pid
+
+    def call(self, worker, method, *args):
+        cache, pid = worker
+        with mock.patch('core.cache_backends.os.getpid', return_value=pid):
+            return getattr(cache, method)(*args)
+
+    def test_shared_between_processes(self):
+        """Запись одного процесса видна другому.
+        """
+        self.call(self.first, 'set', 'key', 'value')
+        self.assertEqual(self.call(self.second, 'get', 'key'), 'value')
+
+    def test_invalidation_reaches_other_l1(self):
+        """Перезапись и удаление выбрасывают ключ из L1 другого процесса.
+        """
+        self.call(self.first, 'set', 'key', 1)
+        self.assertEqual(self.call(self.second, 'get', 'key'), 1)
+        self.call(self.first, 'set', 'key', 2)
+        self.assertEqual(self.call(self.second, 'get', 'key'), 2)
+        self.call(self.first, 'delete', 'key')
+        self.assertIsNone(self.call(self.second, 'get', 'key'))
+        self.call(self.second, 'set', 'key', 3)
+        self.call(self.first, 'clear')
+        self.assertIsNone(self.call(self.second, 'get', 'key'))
+
+    def test_add_is_atomic_across_processes(self):
+        """add удаётся только одному процессу, пока запись жива.
+        """
+        self.assertTrue(self.call(self.first, 'add', 'lock', 1, 10))
+        self.assertFalse(self.call(self.second, 'add', 'lock', 1, 10))
+        self.call(self.first, 'delete', 'lock')
+        self.assertTrue(self.call(self.second, 'add', 'lock', 1, 10))
+
+    def test_incr(self):
+        self.call(self.first, 'set', 'counter', 1)
+        self.call(self.second, 'incr', 'counter')
+        self.assertEqual(self.call(self.first, 'incr', 'counter', 2), 4)
+        with self.assertRaises(ValueError):
+            self.call(self.first, 'incr', 'missing')
+
+    def test_expired(self):
+        self.call(self.first, 'set', 'key', 'value', -1)
+        self.assertIsNone(self.call(self.first, 'get', 'key'))
+        self.assertTrue(self.call(self.second, 'add', 'key', 'new'))
+
+    def test_l1_is_bounded(self):
+        """L1 вытесняет давно не читанные записи, L2 их хранит.
+        """
+        worker = self.worker(1003, L1_MAX_ENTRIES=2)
+        for key in ('a', 'b', 'c'):
+            self.call(worker, 'set', key, key)
+        cache, pid = worker
+        with mock.patch('core.cache_backends.os.getpid', return_value=pid):
+            self.assertEqual(len(cache.l1), 2)
+            self.assertIsNone(cache.l1.get(cache.make_key('a')))
+        self.assertEqual(self.call(worker, 'get', 'a'), 'a')
+        self.assertEqual(
+            self.call(worker, 'get_many', ['a', 'b', 'c', 'd']),
+            {'a': 'a', 'b': 'b', 'c': 'c'},
+        )
+
+    def test_concurrent_write_not_overwritten_by_read(self):
+        """Если поток того же процесса записал ключ, пока другой читал
+        его из L2, прочитанное старое значение не попадает в L1.
+        """
+        self.call(self.first, 'set', 'key', 'old')
+        reader = self.worker(1001)
+        cache, pid = reader
+        with mock.patch('core.cache_backends.os.getpid', return_value=pid):
+            connection = cache._open()
+            cache.l1.clear()
+
+        def read_then_write(sql, *params):
+            cursor = connection.execute(sql, *params)
+            if not sql.startswith('SELECT value'):
+                return cursor
+            row = cursor.fetchone()
+            self.call(self.first, 'set', 'key', 'new')
+            return mock.Mock(fetchone=mock.Mock(return_value=row))
+
+        reading = mock.Mock(execute=read_then_write)
+        with mock.patch.object(cache, '_open', return_value=reading):
+            self.assertEqual(self.call(reader, 'get', 'key'), 'old')
+        self.assertEqual(self.call(reader, 'get', 'key'), 'new')
+
+    def test_l2_is_bounded(self):
+        """Сверх MAX_ENTRIES чистка удаляет записи, что истекают
+        раньше, и выбрасывает их из L1 других процессов.
+        """
+        cache, pid = self.worker(1003, MAX_ENTRIES=4, CULL_FREQUENCY=2)
+        cache.cull_probability = 1
+        self.call(self.second, 'set', 'a', 'a', 10)
+        self.assertEqual(self.call(self.second, 'get', 'a'), 'a')
+        for key, timeout in (('b', 20), ('c', 30), ('d', None), ('e', 40)):
+            self.call((cache, pid), 'set', key, key, timeout)
+        self.assertEqual(self.call((cache, pid), 'entry_count'), 3)
+        self.assertEqual(
+            self.call(self.second, 'get_many', ['a', 'b', 'c', 'd', 'e']),
+            {'c': 'c', 'd': 'd', 'e': 'e'},
+        )
@@ -0,0 +1,130 @@
+import hashlib
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from posts.forms import PostForm
+from posts.images import ingest
+from posts.models import Post
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+User = get_user_model()
+
+
+def jpeg_with_exif(size, orientation=1):
+    image = Image.new('RGB', size, 'red')
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    exif[0x010F] = 'Camera'
+    buffer = BytesIO()
+    image.save(buffer, format='JPEG', exif=exif.tobytes())
+    return SimpleUploadedFile(
+        'photo.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+
+@override_settings(IMAGE_MAX_SIZE=100, IMAGE_QUALITY=85)
+class IngestTest(SimpleTestCase):
+    def test_large_image_is_downscaled_without_exif(self):
+        """Картинка уменьшается до IMAGE_MAX_SIZE и теряет EXIF.
+        """
+        result = Image.open(ingest(jpeg_with_exif((400, 200))))
+        self.assertEqual(result.format, 'JPEG')
+        self.assertEqual(result.size, (100, 50))
+        self.assertNotIn('exif', result.info)
+
+    def test_orientation_applied_before_strip(self):
+        """Поворот из EXIF применяется к пикселям, раз сам EXIF удалён.
+        """
+        result = Image.open(ingest(jpeg_with_exif((80, 40), orientation=6)))
+        self.assertEqual(result.size, (40, 80))
+
+    def test_small_image_keeps_size_and_name(self):
+        upload = ingest(jpeg_with_exif((60, 30)))
+        self.assertEqual(upload.name, 'photo.jpg')
+        self.assertEqual(Image.open(upload).size, (60, 30))
+
+    def test_animation_kept_as_is(self):
+        frames = [Image.new('P', (300, 300), color) for color in (0, 1)]
+        buffer = BytesIO()
+        frames[0].save(
+            buffer, format='GIF', save_all=True, append_images=frames[1:])
+        upload = SimpleUploadedFile('anim.gif', buffer.getvalue())
+        self.assertIs(ingest(upload), upload)
+
+    def test_form_ingests_new_image(self):
+        form = PostForm(
+            {'text': 'photo'}, {'image': jpeg_with_exif((400, 400))})
+        self.assertTrue(form.is_valid(), form.errors)
+        image = Image.open(form.cleaned_data['image'])
+        self.assertEqual(image.size, (100, 100))
+        self.assertNotIn('exif', image.info)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class ImageMetadataTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        # Хранилище sorl в кеше помнит миниатюры из MEDIA_ROOT других тестов
+        cache.clear()
+        self.user = User.objects.create_user(username='meta')
+
+    def test_metadata_filled_on_upload(self):
+        """Размеры, объём, хеш и заглушка сохраняются вместе с постом.
+        """
+        upload = jpeg_with_exif((120, 60))
+        content = upload.read()
+        post = Post.objects.create(
+            author=self.user, text='meta', image=upload)
+        post.refresh_from_db()
+        self.assertEqual((post.image_width, post.image_height), (120, 60))
+        self.assertEqual(post.image_size, len(content))
+        self.assertEqual(
+            post.image_hash, hashlib.sha256(content).hexdigest())
+        self.assertTrue(
+            post.image_placeholder.startswith('data:image/jpeg;base64,'))
+        response = self.client.get(
+            reverse('posts:post_detail', args=(post.pk,)))
+        self.assertContains(response, post.image_placeholder)
+        self.assertContains(response, 'width="960" height="339"')
+
+    def test_metadata_cleared_with_image(self):
+        post = Post.objects.create(
+            author=self.user, text='meta', image=jpeg_with_exif((20, 20)))
+        post.image = None
+        post.save()
+        post.refresh_from_db()
+        self.assertIsNone(post.image_width)
+        self.assertEqual(post.image_hash, '')
+
+    def test_backfill_command(self):
+        """Команда заполняет поля постов, загруженных раньше.
+        """
+        post = Post.objects.create(
+            author=self.user, text='old', image=jpeg_with_exif((30, 10)))
+        Post.objects.filter(pk=post.pk).update(
+            image_width=None, image_height=None, image_size=None,
+            image_hash='', image_placeholder='')
+        broken = Post.objects.create(author=self.user, text='broken')
+        Post.objects.filter(pk=broken.pk).update(image='posts/missing.jpg')
+        out, err = StringIO(), StringIO()
+        call_command('backfill_image_metadata', stdout=out, stderr=err)
+        self.assertIn('Заполнено постов: 1, с ошибками: 1', out.getvalue())
+        self.assertIn('missing.jpg', err.getvalue())
+        post.refresh_from_db()
+        self.assertEqual((post.image_width, post.image_height), (30, 10))
+        self.assertEqual(post.image_size, post.image.size)
+        self.assertEqual(len(post.image_hash), 64)
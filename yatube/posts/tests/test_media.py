@@ -0,0 +1,129 @@
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.test import RequestFactory, TestCase, override_settings
+
+from core.media import serve
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+CONTENT = bytes(range(256)) * 4
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, MEDIA_SENDFILE=None)
+class MediaServeTest(TestCase):
+    """Отдача медиа без DEBUG: валидаторы, Range и sendfile.
+    """
+    url = '/media/posts/file.bin'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        os.makedirs(os.path.join(TEMP_MEDIA_ROOT, 'posts'), exist_ok=True)
+        with open(os.path.join(TEMP_MEDIA_ROOT, 'posts', 'file.bin'),
+                  'wb') as file:
+            file.write(CONTENT)
+        with open(os.path.join(TEMP_MEDIA_ROOT, 'posts', '.hidden'),
+                  'wb') as file:
+            file.write(b'partial')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_full_file(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), CONTENT)
+        self.assertEqual(response['Content-Length'], str(len(CONTENT)))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertFalse(response['ETag'].startswith('W/'))
+        self.assertIn('max-age', response['Cache-Control'])
+        # Медиа не проходит через сессии и аутентификацию
+        self.assertFalse(response.cookies)
+        self.assertFalse(response.has_header('Vary'))
+
+    def test_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_range(self):
+        """Отдаётся ровно запрошенный диапазон байт.
+        """
+        cases = {
+            'bytes=10-19': (10, 19),
+            'bytes=1000-': (1000, len(CONTENT) - 1),
+            'bytes=-24': (len(CONTENT) - 24, len(CONTENT) - 1),
+            'bytes=1020-5000': (1020, len(CONTENT) - 1),
+        }
+        for header, (start, end) in cases.items():
+            with self.subTest(range=header):
+                response = self.client.get(self.url, HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(
+                    b''.join(response.streaming_content),
+                    CONTENT[start:end + 1])
+                self.assertEqual(
+                    response['Content-Range'],
+                    f'bytes {start}-{end}/{len(CONTENT)}')
+                self.assertEqual(
+                    response['Content-Length'], str(end - start + 1))
+
+    def test_sendfile_only_for_whole_file(self):
+        """Дескриптор для sendfile сервер получает только у файла
+        целиком: uWSGI отправил бы через него весь файл и вместо
+        диапазона.
+        """
+        factory = RequestFactory()
+        whole = serve(factory.get(self.url), 'posts/file.bin')
+        part = serve(
+            factory.get(self.url, HTTP_RANGE='bytes=10-19'), 'posts/file.bin')
+        self.assertTrue(hasattr(whole.file_to_stream, 'fileno'))
+        self.assertFalse(hasattr(part.file_to_stream, 'fileno'))
+        self.assertEqual(b''.join(part.streaming_content), CONTENT[10:20])
+        whole.close()
+        part.close()
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=5000-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(CONTENT)}')
+
+    def test_if_range_mismatch_returns_full_file(self):
+        response = self.client.get(
+            self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), CONTENT)
+
+    def test_not_found(self):
+        for url in ('/media/posts/missing.bin', '/media/posts/.hidden',
+                    '/media/../manage.py', '/media/posts/'):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+
+    @override_settings(
+        MEDIA_SENDFILE='x-accel-redirect',
+        MEDIA_ACCEL_PREFIX='/protected-media/')
+    def test_x_accel_redirect(self):
+        """С X-Accel-Redirect тело и Range отдаёт nginx.
+        """
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(
+            response['X-Accel-Redirect'], '/protected-media/posts/file.bin')
+
+    @override_settings(MEDIA_SENDFILE='x-sendfile')
+    def test_x_sendfile(self):
+        response = self.client.get(self.url)
+        self.assertEqual(
+            response['X-Sendfile'],
+            os.path.join(TEMP_MEDIA_ROOT, 'posts', 'file.bin'))
+
+    def test_post_not_allowed(self):
+        self.assertEqual(self.client.post(self.url).status_code, 405)
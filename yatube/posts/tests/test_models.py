@@ -1,7 +1,12 @@
+from io import StringIO
+
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
 from django.test import TestCase
 
-from posts.models import Post, Group
+from core.object_cache import cached_object
+from posts.models import Post, Group, Profile
 
 User = get_user_model()
 
@@ -53,3 +58,82 @@ class PostModelTest(TestCase):
         post = PostModelTest.post
         expected_object_name = post.text[:15]
         self.assertEqual(expected_object_name, str(post))
+
+
+class PostCounterTest(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Test_counter')
+        cls.group = Group.objects.create(title='first', slug='first')
+        cls.other_group = Group.objects.create(title='second', slug='second')
+
+    def assert_counts(self, user_posts, group_posts, other_group_posts):
+        self.user.profile.refresh_from_db()
+        self.group.refresh_from_db()
+        self.other_group.refresh_from_db()
+        self.assertEqual(self.user.profile.post_count, user_posts)
+        self.assertEqual(self.group.post_count, group_posts)
+        self.assertEqual(self.other_group.post_count, other_group_posts)
+
+    def test_counters_follow_posts(self):
+        """Счётчики постов меняются при создании, переносе и удалении.
+        """
+        post = Post.objects.create(
+            author=self.user, text='counter', group=self.group)
+        self.assert_counts(1, 1, 0)
+        post.group = self.other_group
+        post.save()
+        self.assert_counts(1, 0, 1)
+        post.delete()
+        self.assert_counts(0, 0, 0)
+
+    def test_reconcile_counters(self):
+        """Команда reconcile_counters исправляет расхождения.
+        """
+        Post.objects.create(author=self.user, text='drift', group=self.group)
+        Profile.objects.filter(user=self.user).update(post_count=42)
+        Group.objects.filter(pk=self.group.pk).update(post_count=7)
+        call_command('reconcile_counters', chunk_size=1, stdout=StringIO())
+        self.assert_counts(1, 1, 0)
+
+
+class ObjectCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_read_through(self):
+        """Повторный поиск группы по slug не ходит в базу, а новый
+        пост сбрасывает запись, потому что меняет счётчик группы.
+        """
+        group = Group.objects.create(title='cached', slug='cached')
+        with self.assertNumQueries(1):
+            cached_object(Group, 'slug', 'cached')
+        with self.assertNumQueries(0):
+            self.assertEqual(cached_object(Group, 'slug', 'cached'), group)
+        author = User.objects.create_user(username='cached_author')
+        Post.objects.create(author=author, text='cached', group=group)
+        self.assertEqual(
+            cached_object(Group, 'slug', 'cached').post_count, 1)
+
+    def test_negative_caching(self):
+        """Отсутствие объекта кешируется до его создания.
+        """
+        with self.assertNumQueries(1):
+            self.assertIsNone(cached_object(User, 'username', 'later'))
+        with self.assertNumQueries(0):
+            self.assertIsNone(cached_object(User, 'username', 'later'))
+        user = User.objects.create_user(username='later')
+        self.assertEqual(cached_object(User, 'username', 'later'), user)
+
+    def test_rename_and_delete(self):
+        """Переименование сбрасывает старый ключ, удаление — новый.
+        """
+        user = User.objects.create_user(username='old_name')
+        cached_object(User, 'username', 'old_name')
+        user.username = 'new_name'
+        user.save()
+        self.assertIsNone(cached_object(User, 'username', 'old_name'))
+        self.assertEqual(cached_object(User, 'username', 'new_name'), user)
+        user.delete()
+        self.assertIsNone(cached_object(User, 'username', 'new_name'))
@@ -0,0 +1,113 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts import urls
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+# Предельное число SQL-запросов на один запрос к каждому маршруту
+# posts.urls для авторизованного пользователя. Сюда входят загрузка
+# сессии и пользователя; от числа постов и комментариев оно не зависит.
+# profile и post_detail тратят ещё один запрос по индексу на валидаторы
+# условного GET, follow_index на холодном кеше — на множество подписок,
+# search — выборку id из индекса FTS5 и затем сами посты, autocomplete
+# на пустом кеше — постройку индекса в памяти, а дальше обходится без базы.
+QUERY_BUDGET = {
+    'index': 4,
+    'group_list': 4,
+    'profile': 6,
+    'post_detail': 5,
+    'post_edit': 4,
+    'add_comment': 4,
+    'post_comments': 3,
+    'post_create': 3,
+    'search': 4,
+    'autocomplete': 4,
+    'follow_index': 5,
+    'profile_follow': 4,
+    'profile_unfollow': 7,
+}
+
+
+class QueryBudgetTests(TestCase):
+    """Число запросов к базе на страницу фиксировано и не растёт
+    вместе с числом постов, авторов и комментариев (нет N+1).
+    """
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='budget')
+        cls.group = Group.objects.create(title='budget', slug='budget')
+        authors = [
+            User.objects.create_user(username=f'author_{i}')
+            for i in range(3)
+        ]
+        cls.author = authors[0]
+        for author in authors:
+            Follow.objects.create(user=cls.user, author=author)
+        for i in range(12):
+            Post.objects.create(
+                author=authors[i % len(authors)],
+                text=f'budget post {i}',
+                group=cls.group,
+            )
+        cls.post = Post.objects.create(
+            author=cls.user, text='own post', group=cls.group)
+        for author in authors:
+            Comment.objects.create(
+                post=cls.post, author=author, text='budget comment')
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.user)
+        cache.clear()
+
+    def requests(self):
+        """Запрос к каждому маршруту posts.urls: (имя, метод, адрес, данные).
+        """
+        post_kwargs = {'post_id': self.post.pk}
+        author_kwargs = {'username': self.author.username}
+        return {
+            'index': ('get', reverse('posts:index'), None),
+            'group_list': ('get', reverse(
+                'posts:group_list', kwargs={'slug': self.group.slug}), None),
+            'profile': ('get', reverse(
+                'posts:profile', kwargs=author_kwargs), None),
+            'post_detail': ('get', reverse(
+                'posts:post_detail', kwargs=post_kwargs), None),
+            'post_edit': ('get', reverse(
+                'posts:post_edit', kwargs=post_kwargs), None),
+            'add_comment': ('post', reverse(
+                'posts:add_comment', kwargs=post_kwargs), {'text': 'new'}),
+            'post_comments': ('get', reverse(
+                'posts:post_comments', kwargs=post_kwargs), None),
+            'post_create': ('get', reverse('posts:post_create'), None),
+            'search': ('get', reverse('posts:search'), {'q': 'budget'}),
+            'autocomplete': ('get', reverse('posts:autocomplete'), {'q': 'a'}),
+            'follow_index': ('get', reverse('posts:follow_index'), None),
+            'profile_follow': ('get', reverse(
+                'posts:profile_follow', kwargs=author_kwargs), None),
+            'profile_unfollow': ('get', reverse(
+                'posts:profile_unfollow', kwargs=author_kwargs), None),
+        }
+
+    def test_every_route_has_budget(self):
+        names = {pattern.name for pattern in urls.urlpatterns}
+        self.assertEqual(names, set(QUERY_BUDGET))
+
+    def test_query_budget(self):
+        for name, (method, address, data) in self.requests().items():
+            with self.subTest(name=name):
+                cache.clear()
+                with CaptureQueriesContext(connection) as queries:
+                    getattr(self.client, method)(address, data)
+                self.assertLessEqual(
+                    len(queries),
+                    QUERY_BUDGET[name],
+                    '\n'.join(query['sql'] for query in queries),
+                )
@@ -0,0 +1,108 @@
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+
+from posts.feeds import follow_feed, pulled_authors
+from posts.models import Comment, Follow, Group, Post, Profile
+from posts.paginators import CursorPaginator, decode_cursor, encode_cursor
+
+User = get_user_model()
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN из SQLite')
+class QueryPlanTests(TestCase):
+    """Каждый запрос лент обслуживается индексом: без полного
+    просмотра таблицы и без сортировки во временном B-дереве.
+    """
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='planner')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(title='plan', slug='plan')
+        cls.post = Post.objects.create(
+            author=cls.author, text='plan', group=cls.group)
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.cursor = decode_cursor(
+            encode_cursor(cls.post.pub_date, cls.post.pk))
+
+    def explain(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assert_indexed(self, queryset):
+        details = self.explain(queryset)
+        for detail in details:
+            self.assertNotIn('TEMP B-TREE', detail, details)
+            if detail.startswith('SCAN'):
+                self.assertIn('USING', detail, details)
+
+    def feed_pages(self, queryset, cursor_fields=('pub_date', 'pk')):
+        """Запросы первой страницы и страниц по курсорам в обе стороны.
+        """
+        rows = CursorPaginator._rows
+        return [
+            rows(queryset, cursor_fields, None, False, 11),
+            rows(queryset, cursor_fields, self.cursor, False, 11),
+            rows(queryset, cursor_fields, self.cursor, True, 11),
+        ]
+
+    def test_index_feed(self):
+        for queryset in self.feed_pages(Post.objects.select_related('group')):
+            with self.subTest(sql=str(queryset.query)):
+                self.assert_indexed(queryset)
+
+    def test_group_feed(self):
+        for queryset in self.feed_pages(Post.objects.filter(group=self.group)):
+            with self.subTest(sql=str(queryset.query)):
+                self.assert_indexed(queryset)
+
+    def test_profile_feed(self):
+        for queryset in self.feed_pages(
+                Post.objects.filter(author=self.author)):
+            with self.subTest(sql=str(queryset.query)):
+                self.assert_indexed(queryset)
+
+    def test_follow_feed(self):
+        pulled = pulled_authors([self.author.pk])
+        for queryset, cursor_fields, _ in follow_feed(self.reader, pulled):
+            for page in self.feed_pages(queryset, cursor_fields):
+                with self.subTest(sql=str(page.query)):
+                    self.assert_indexed(page)
+
+    def test_follow_feed_pulled_authors(self):
+        Profile.objects.filter(user=self.author).update(feed_pulled=True)
+        pulled = pulled_authors([self.author.pk])
+        self.assertEqual(pulled, [self.author.pk])
+        for queryset, cursor_fields, _ in follow_feed(self.reader, pulled):
+            for page in self.feed_pages(queryset, cursor_fields):
+                with self.subTest(sql=str(page.query)):
+                    self.assert_indexed(page)
+
+    def test_comments(self):
+        comments = Comment.objects.filter(
+            post=self.post).select_related('author')
+        for queryset in self.feed_pages(comments, ('created', 'pk')):
+            with self.subTest(sql=str(queryset.query)):
+                self.assert_indexed(queryset)
+
+    def test_follow_lookups(self):
+        querysets = [
+            Follow.objects.filter(user=self.reader, author=self.author),
+            Follow.objects.filter(user=self.reader).values_list(
+                'author_id', flat=True),
+            Follow.objects.filter(author=self.author).values_list(
+                'user_id', flat=True),
+            Follow.objects.filter(user=self.reader).order_by(
+                'author_id').values_list('author_id', flat=True),
+            Profile.objects.filter(
+                user_id__in=[self.author.pk], follower_count__gt=0,
+            ).values_list('user_id', flat=True),
+        ]
+        for queryset in querysets:
+            with self.subTest(sql=str(queryset.query)):
+                self.assert_indexed(queryset)
@@ -0,0 +1,132 @@
+from unittest import skipUnless
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from posts.models import Group, Post
+from posts.search import encode_score_cursor, match_expression
+
+User = get_user_model()
+
+SEARCH_URL = reverse('posts:search')
+
+
+class MatchExpressionTests(TestCase):
+    def test_terms_are_quoted_prefixes(self):
+        """Слова запроса становятся префиксами в кавычках, а операторы
+        FTS5 из ввода не проходят.
+        """
+        self.assertEqual(
+            match_expression('Котики OR "NEAR(" -dogs'),
+            '"котики"* "or"* "near"* "dogs"*')
+        self.assertEqual(match_expression(' ,.- '), '')
+
+
+@skipUnless(connection.vendor == 'sqlite', 'FTS5 из SQLite')
+class SearchViewTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='searcher')
+        cls.group = Group.objects.create(
+            title='Кошки', slug='cats', description='Всё о котиках')
+
+    def setUp(self):
+        self.client = Client()
+
+    def search(self, query, **params):
+        return self.client.get(SEARCH_URL, {'q': query, **params})
+
+    def found(self, query, **params):
+        return list(self.search(query, **params).context['page_obj'])
+
+    def test_text_match_ranks_above_group_match(self):
+        """Совпадение в тексте поста весит больше, чем в описании
+        группы; слово находится по началу и в другом падеже.
+        """
+        in_group = Post.objects.create(
+            author=self.author, text='Фотография', group=self.group)
+        in_text = Post.objects.create(author=self.author, text='Котик спит')
+        Post.objects.create(author=self.author, text='Про собак')
+        self.assertEqual(self.found('котик'), [in_text, in_group])
+
+    def test_all_terms_required(self):
+        post = Post.objects.create(author=self.author, text='Рыжий кот')
+        Post.objects.create(author=self.author, text='Рыжий пёс')
+        self.assertEqual(self.found('кот рыжий'), [post])
+
+    def test_index_follows_changes(self):
+        """Триггеры обновляют индекс при правке поста и группы
+        и при удалении поста.
+        """
+        post = Post.objects.create(author=self.author, text='Первый')
+        post.text = 'Второй'
+        post.save()
+        self.assertEqual(self.found('первый'), [])
+        self.assertEqual(self.found('второй'), [post])
+        post.group = self.group
+        post.save()
+        self.group.title = 'Пушистые'
+        self.group.save()
+        self.assertEqual(self.found('пушист'), [post])
+        post.delete()
+        self.assertEqual(self.found('второй'), [])
+
+    def test_empty_query(self):
+        Post.objects.create(author=self.author, text='Что угодно')
+        response = self.search('')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['page_obj']), [])
+
+    def test_cursor_pages(self):
+        """Курсоры листают выдачу вперёд и назад без пропусков
+        и повторов, а ссылки страниц сохраняют запрос.
+        """
+        posts = [
+            Post.objects.create(author=self.author, text='тест ' * (i + 1))
+            for i in range(settings.MAX + 3)
+        ]
+        first = self.search('тест')
+        page = first.context['page_obj']
+        self.assertEqual(len(page), settings.MAX)
+        next_cursor = page.paginator.next_cursor
+        self.assertContains(first, '?q=%D1%82%D0%B5%D1%81%D1%82&amp;after=')
+        second = self.found('тест', after=next_cursor)
+        self.assertEqual(
+            {post.pk for post in list(page) + second},
+            {post.pk for post in posts})
+        paginator = self.search(
+            'тест', after=next_cursor).context['page_obj'].paginator
+        back = self.found('тест', before=paginator.previous_cursor)
+        self.assertEqual(back, list(page))
+
+    def test_broken_cursor(self):
+        post = Post.objects.create(author=self.author, text='курсор')
+        self.assertEqual(self.found('курсор', after='!!!'), [post])
+        for cursor in (
+            encode_score_cursor(-1.0, 10 ** 30),
+            encode_score_cursor(float('nan'), post.pk),
+        ):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.found('курсор', after=cursor), [post])
+
+
+@skipUnless(connection.vendor == 'sqlite', 'FTS5 из SQLite')
+class AdminSearchTests(TestCase):
+    def test_admin_uses_index(self):
+        """Поиск в админке ищет по индексу, в том числе по группе.
+        """
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='admin')
+        group = Group.objects.create(title='Птицы', slug='birds')
+        post = Post.objects.create(author=admin, text='Синица', group=group)
+        Post.objects.create(author=admin, text='Ворона')
+        client = Client()
+        client.force_login(admin)
+        response = client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'птиц'})
+        self.assertEqual(
+            list(response.context['cl'].result_list), [post])
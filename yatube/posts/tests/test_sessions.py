@@ -0,0 +1,128 @@
+from http import HTTPStatus
+
+from django.conf import settings
+from django.contrib.sessions.backends.base import UpdateError
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from core.sessions import SessionStore, flush_pending
+from posts.models import Post
+
+User = get_user_model()
+
+
+class CachedSessionTest(TestCase):
+    """Сессия и пользователь запроса берутся из кеша, а вход, выход
+    и смена пароля работают как раньше.
+    """
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(
+            username='session', password='secret-pass')
+        Post.objects.create(author=cls.user, text='session post')
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def test_warm_index_without_queries(self):
+        """Повторный запрос авторизованного пользователя к главной
+        не ходит в базу даже за сессией и пользователем.
+        """
+        # Первый ответ ставит CSRF-cookie, а страница зависит от cookie
+        for _ in range(2):
+            self.client.get(reverse('posts:index'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('posts:index'))
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def assert_logged_out(self, client):
+        response = client.get(reverse('posts:post_create'))
+        self.assertEqual(response.status_code, HTTPStatus.FOUND)
+
+    def test_logout(self):
+        """После выхода старая cookie сессии не авторизует.
+        """
+        cookie = self.client.cookies[settings.SESSION_COOKIE_NAME].value
+        self.client.get(reverse('posts:post_create'))
+        self.client.logout()
+        stale = Client()
+        stale.cookies[settings.SESSION_COOKIE_NAME] = cookie
+        self.assert_logged_out(stale)
+
+    def test_password_change(self):
+        """Смена пароля разлогинивает, хотя пользователь был в кеше.
+        """
+        self.client.get(reverse('posts:post_create'))
+        self.user.set_password('new-secret-pass')
+        self.user.save()
+        self.assert_logged_out(self.client)
+
+    def test_deactivated_user(self):
+        self.client.get(reverse('posts:post_create'))
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.user.refresh_from_db()
+        self.user.save()
+        self.assert_logged_out(self.client)
+
+    def test_write_behind(self):
+        """Изменение сессии сразу видно из кеша, в базу оно попадает
+        пачкой, а удалённая сессия не воскрешается.
+        """
+        session = SessionStore()
+        session['step'] = 1
+        session.create()
+        session['step'] = 2
+        session.save()
+        self.assertEqual(SessionStore(session.session_key)['step'], 2)
+        row = Session.objects.get(session_key=session.session_key)
+        self.assertEqual(row.get_decoded()['step'], 1)
+        flush_pending(force=True)
+        row.refresh_from_db()
+        self.assertEqual(row.get_decoded()['step'], 2)
+        session['step'] = 3
+        session.save()
+        session.delete()
+        flush_pending(force=True)
+        self.assertFalse(
+            Session.objects.filter(session_key=session.session_key).exists())
+
+    def test_parallel_request_after_logout(self):
+        """Запрос, загрузивший сессию до выхода, не может записать её
+        обратно после выхода.
+        """
+        session = SessionStore()
+        session['_auth_user_id'] = str(self.user.pk)
+        session.create()
+        parallel = SessionStore(session.session_key)
+        self.assertEqual(parallel['_auth_user_id'], str(self.user.pk))
+        session.flush()
+        parallel['step'] = 1
+        with self.assertRaises(UpdateError):
+            parallel.save()
+        flush_pending(force=True)
+        restored = SessionStore(session.session_key).load()
+        self.assertNotIn('_auth_user_id', restored)
+        self.assertFalse(
+            Session.objects.filter(session_key=session.session_key).exists())
+
+    def test_parallel_request_after_logout_via_client(self):
+        """Поздний ответ параллельного запроса после выхода
+        отклоняется, а старая cookie не авторизует.
+        """
+        cookie = self.client.cookies[settings.SESSION_COOKIE_NAME].value
+        self.client.get(reverse('posts:post_create'))
+        parallel = SessionStore(cookie)
+        self.assertEqual(parallel['_auth_user_id'], str(self.user.pk))
+        self.client.logout()
+        parallel['visited'] = True
+        with self.assertRaises(UpdateError):
+            parallel.save()
+        stale = Client()
+        stale.cookies[settings.SESSION_COOKIE_NAME] = cookie
+        self.assert_logged_out(stale)
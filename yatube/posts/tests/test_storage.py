@@ -0,0 +1,139 @@
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from sorl.thumbnail import get_thumbnail
+from sorl.thumbnail.base import ThumbnailBackend
+
+from posts.models import MediaBlob, Post
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+User = get_user_model()
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+def upload(name='small.gif', content=SMALL_GIF):
+    return SimpleUploadedFile(name, content, content_type='image/gif')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+@mock.patch(
+    'posts.signals.transaction.on_commit', side_effect=lambda f: f())
+class ContentAddressedStorageTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        # Хранилище sorl в кеше помнит миниатюры из MEDIA_ROOT других тестов
+        cache.clear()
+        self.user = User.objects.create_user(username='blobs')
+
+    def create(self, **kwargs):
+        return Post.objects.create(author=self.user, text='blob', **kwargs)
+
+    def test_identical_uploads_stored_once(self, on_commit):
+        """Одинаковое содержимое под разными именами — один файл.
+        """
+        first = self.create(image=upload('one.GIF'))
+        second = self.create(image=upload('two.gif'))
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(
+            first.image.name,
+            f'posts/{first.image_hash[:2]}/{first.image_hash}.gif')
+        self.assertEqual(MediaBlob.objects.get().ref_count, 2)
+
+    def test_thumbnails_shared(self, on_commit):
+        first = self.create(image=upload())
+        get_thumbnail(first.image, '960x339', crop='center')
+        second = self.create(image=upload('copy.gif'))
+        with mock.patch.object(
+                ThumbnailBackend, '_create_thumbnail') as create:
+            get_thumbnail(second.image, '960x339', crop='center')
+        create.assert_not_called()
+
+    def test_file_deleted_with_last_reference(self, on_commit):
+        """Файл и его миниатюры удаляются вместе с последним постом.
+        """
+        first = self.create(image=upload())
+        second = self.create(image=upload())
+        storage = first.image.storage
+        name = first.image.name
+        thumbnail = get_thumbnail(first.image, '960x339', crop='center')
+        first.delete()
+        self.assertTrue(storage.exists(name))
+        second.delete()
+        self.assertFalse(storage.exists(name))
+        self.assertFalse(thumbnail.exists())
+        self.assertFalse(MediaBlob.objects.exists())
+
+    def test_replaced_image_released(self, on_commit):
+        post = self.create(image=upload())
+        old_name = post.image.name
+        post.image = upload('other.gif', SMALL_GIF + b'\x00')
+        post.save()
+        self.assertFalse(post.image.storage.exists(old_name))
+        self.assertEqual(
+            list(MediaBlob.objects.values_list('name', 'ref_count')),
+            [(post.image.name, 1)])
+
+    def test_untracked_file_kept(self, on_commit):
+        """Файлы без учёта ссылок (загруженные раньше) не удаляются.
+        """
+        post = self.create(image=upload())
+        MediaBlob.objects.all().delete()
+        post.delete()
+        self.assertTrue(post.image.storage.exists(post.image.name))
+
+    def test_reconcile_counts_legacy_files(self, on_commit):
+        """reconcile_counters ставит на учёт файлы, загруженные раньше.
+        """
+        post = self.create(image=upload())
+        self.create(image=upload())
+        MediaBlob.objects.all().delete()
+        MediaBlob.objects.create(name='posts/gone.gif', ref_count=3)
+        out = StringIO()
+        call_command('reconcile_counters', stdout=out)
+        self.assertIn('файлов картинок: 2', out.getvalue())
+        self.assertEqual(
+            list(MediaBlob.objects.values_list('name', 'ref_count')),
+            [(post.image.name, 2)])
+
+    def test_reconcile_blobs_in_name_chunks(self, on_commit):
+        """Ссылки сверяются пачками по диапазонам имён: имена
+        на границах пачек не теряются и не считаются дважды.
+        """
+        names = ['posts/a.gif', 'posts/b.gif', 'posts/b.gif', 'posts/c.gif']
+        for name in names:
+            post = self.create()
+            Post.objects.filter(pk=post.pk).update(image=name)
+        MediaBlob.objects.all().delete()
+        MediaBlob.objects.bulk_create([
+            MediaBlob(name='posts/a.gif', ref_count=1),
+            MediaBlob(name='posts/b.gif', ref_count=5),
+            MediaBlob(name='posts/d.gif', ref_count=1),
+        ])
+        out = StringIO()
+        call_command('reconcile_counters', chunk_size=1, stdout=out)
+        self.assertIn('файлов картинок: 3', out.getvalue())
+        self.assertEqual(
+            list(MediaBlob.objects.order_by('name').values_list(
+                'name', 'ref_count')),
+            [('posts/a.gif', 1), ('posts/b.gif', 2), ('posts/c.gif', 1)])
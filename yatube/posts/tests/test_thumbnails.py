@@ -0,0 +1,188 @@
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.base import ThumbnailBackend
+
+from posts.models import Post
+from posts.thumbnails import (
+    attach_thumbnails, display_size, generate, single_flight,
+)
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+User = get_user_model()
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class PregenerateTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        # Хранилище sorl в кеше помнит миниатюры из MEDIA_ROOT других тестов
+        cache.clear()
+        self.user = User.objects.create_user(username='thumbs')
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    @mock.patch(
+        'posts.thumbnails.transaction.on_commit', side_effect=lambda f: f())
+    def test_thumbnails_ready_after_create(self, on_commit):
+        """После создания поста миниатюры уже есть в хранилище sorl.
+        """
+        self.client.post(reverse('posts:post_create'), {
+            'text': 'with image',
+            'image': SimpleUploadedFile(
+                'thumbs.gif', SMALL_GIF, content_type='image/gif'),
+        })
+        post = Post.objects.get(text='with image')
+        on_commit.assert_called_once()
+        with mock.patch.object(
+                ThumbnailBackend, '_create_thumbnail') as create:
+            for geometry, options in settings.THUMBNAIL_VARIANTS:
+                self.assertTrue(
+                    get_thumbnail(post.image, geometry, **options).exists())
+        create.assert_not_called()
+
+    def test_page_thumbnails_resolved_in_one_batch(self):
+        """Миниатюры страницы ленты читаются одним get_many.
+        """
+        posts = [
+            Post.objects.create(
+                author=self.user, text=f'image {number}',
+                image=SimpleUploadedFile(
+                    f'batch{number}.gif', SMALL_GIF,
+                    content_type='image/gif'))
+            for number in range(3)
+        ]
+        posts.append(Post.objects.create(author=self.user, text='plain'))
+        for post in posts[:3]:
+            generate(post.image)
+        attach_thumbnails(posts)
+        self.assertIsNone(posts[3].thumbnail)
+        storage_cache = default.kvstore.cache
+        with mock.patch.object(
+                storage_cache, 'get_many',
+                wraps=storage_cache.get_many) as get_many, \
+                mock.patch.object(
+                    ThumbnailBackend, '_create_thumbnail') as create:
+            urls = [post.thumbnail.url for post in posts[:3]]
+        get_many.assert_called_once()
+        create.assert_not_called()
+        # Одинаковые картинки лежат в одном файле и делят миниатюру
+        self.assertEqual(len(set(urls)), 1)
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, urls[0])
+
+    @override_settings(THUMBNAIL_SRCSET_FORMAT='PNG')
+    def test_srcset_variants(self):
+        """Пост получает srcset из вариантов THUMBNAIL_SRCSET.
+        """
+        post = Post.objects.create(
+            author=self.user, text='srcset',
+            image=SimpleUploadedFile(
+                'srcset.gif', SMALL_GIF, content_type='image/gif'))
+        attach_thumbnails([post])
+        self.assertEqual(post.srcset_type, 'image/png')
+        candidates = str(post.srcset).split(', ')
+        self.assertEqual(
+            [candidate.rsplit(' ', 1)[1] for candidate in candidates],
+            [f'{geometry.split("x")[0]}w'
+             for geometry, _ in settings.THUMBNAIL_SRCSET])
+        self.assertTrue(all('.png ' in item for item in candidates))
+        response = self.client.get(
+            reverse('posts:post_detail', args=(post.pk,)))
+        self.assertContains(response, 'type="image/png"')
+
+    @override_settings(THUMBNAIL_SRCSET_FORMAT='NOSUCHFORMAT')
+    def test_no_srcset_without_format_support(self):
+        post = Post.objects.create(
+            author=self.user, text='fallback',
+            image=SimpleUploadedFile(
+                'fallback.gif', SMALL_GIF, content_type='image/gif'))
+        attach_thumbnails([post])
+        self.assertEqual(post.srcset, '')
+        self.assertIsNotNone(post.thumbnail.url)
+
+    def test_size_from_stored_dimensions(self):
+        """Размеры <img> берутся из полей поста, и без миниатюры
+        в хранилище sorl пост показывает заглушку нужного размера.
+        """
+        post = Post.objects.create(
+            author=self.user, text='stored',
+            image=SimpleUploadedFile(
+                'stored.gif', SMALL_GIF, content_type='image/gif'))
+        cache.clear()
+        with mock.patch.object(
+                ThumbnailBackend, 'get_thumbnail', return_value=None):
+            response = self.client.get(
+                reverse('posts:post_detail', args=(post.pk,)))
+        self.assertContains(response, 'width="960" height="339"')
+        self.assertContains(response, f'src="{post.image_placeholder}"')
+
+
+class DisplaySizeTest(SimpleTestCase):
+    def test_matches_sorl_geometry(self):
+        cases = [
+            ((120, 60), ('960x339', {'crop': 'center', 'upscale': True}),
+             (960, 339)),
+            ((200, 50), ('100x100', {}), (100, 25)),
+            ((50, 20), ('100x100', {'upscale': False}), (50, 20)),
+            ((400, 100), ('100x100', {'crop': 'center'}), (100, 100)),
+            ((400, 100), ('100', {}), (100, 25)),
+        ]
+        for size, variant, expected in cases:
+            with self.subTest(size=size, variant=variant):
+                self.assertEqual(display_size(*size, variant), expected)
+
+
+class SingleFlightTest(SimpleTestCase):
+    def test_concurrent_calls_share_one_computation(self):
+        """Одновременные запросы одного ключа ждут одно вычисление.
+        """
+        calls = []
+        results = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.05)
+            return 'thumbnail'
+
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(
+                    single_flight('variant', compute)))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['thumbnail'] * 5)
+
+    def test_error_reaches_waiters_and_is_not_cached(self):
+        with self.assertRaises(ValueError):
+            single_flight('broken', mock.Mock(side_effect=ValueError))
+        self.assertEqual(single_flight('broken', lambda: 'ok'), 'ok')
@@ -0,0 +1,139 @@
+import hashlib
+import os
+import shutil
+import struct
+import tempfile
+import zlib
+from io import BytesIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from posts.images import ingest
+from posts.models import Post
+from posts.uploads import upload_temp_dir
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+User = get_user_model()
+
+
+def png_bytes(size=(40, 20)) -> bytes:
+    buffer = BytesIO()
+    Image.new('RGB', size, 'blue').save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def png_header(width: int, height: int) -> bytes:
+    """Начало PNG, которое обещает картинку width x height.
+    """
+    ihdr = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    chunk = b'IHDR' + ihdr
+    return (b'\x89PNG\r\n\x1a\n' + struct.pack('>I', len(ihdr)) + chunk
+            + struct.pack('>I', zlib.crc32(chunk))
+            + struct.pack('>I', 1024) + b'IDAT' + b'\x00' * 1024)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class StreamingUploadTest(TestCase):
+    """Загрузка картинок пишется на диск по кускам и хешируется на лету.
+    """
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='uploader')
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def create(self, name, content):
+        return self.client.post(reverse('posts:post_create'), {
+            'text': name,
+            'image': SimpleUploadedFile(name, content),
+        })
+
+    def staged_files(self) -> list:
+        directory = os.path.join(TEMP_MEDIA_ROOT, '.uploads')
+        return os.listdir(directory) if os.path.isdir(directory) else []
+
+    def test_clean_image_stored_as_uploaded(self):
+        """Картинка без метаданных сохраняется байт в байт, хеш
+        посчитан при приёме, временный файл перенесён на место.
+        """
+        content = png_bytes()
+        self.create('clean.png', content)
+        post = Post.objects.get(text='clean.png')
+        digest = hashlib.sha256(content).hexdigest()
+        self.assertEqual(post.image_hash, digest)
+        self.assertEqual(post.image.name, f'posts/{digest[:2]}/{digest}.png')
+        with post.image.open('rb') as file:
+            self.assertEqual(file.read(), content)
+        self.assertEqual(self.staged_files(), [])
+
+    def test_not_an_image_rejected(self):
+        response = self.create('fake.png', b'#!/bin/sh\necho hello\n' * 100)
+        self.assertFalse(Post.objects.filter(text='fake.png').exists())
+        self.assertFormError(
+            response, 'form', 'image',
+            'Загрузите картинку в формате JPEG, PNG, GIF, WebP или BMP.')
+        self.assertEqual(self.staged_files(), [])
+
+    @override_settings(IMAGE_UPLOAD_MAX_SIZE=2 * 1024 * 1024)
+    def test_oversized_upload_rejected(self):
+        response = self.create(
+            'big.png', png_header(100, 100) + b'\x00' * 3 * 1024 * 1024)
+        self.assertFormError(
+            response, 'form', 'image', 'Картинка больше 2 МБ.')
+        self.assertEqual(self.staged_files(), [])
+
+    def test_decompression_bomb_rejected_from_header(self):
+        """Разрешение проверяется по заголовку, до приёма пикселей.
+        """
+        response = self.create('bomb.png', png_header(100000, 100000))
+        self.assertFormError(
+            response, 'form', 'image', 'Слишком большое разрешение.')
+
+    @override_settings(IMAGE_MAX_SIZE=20)
+    def test_reencoded_upload_stays_on_disk(self):
+        """Пересохранённая картинка пишется во временный файл рядом
+        с хранилищем, с хешем, и переносится на место переименованием.
+        """
+        reencoded = ingest(SimpleUploadedFile('wide.png', png_bytes()))
+        self.assertTrue(reencoded.temporary_file_path().startswith(
+            upload_temp_dir()))
+        content = reencoded.read()
+        self.assertEqual(reencoded.size, len(content))
+        self.assertEqual(
+            reencoded.sha256, hashlib.sha256(content).hexdigest())
+        reencoded.close()
+        self.create('wide.png', png_bytes())
+        post = Post.objects.get(text='wide.png')
+        with post.image.open('rb') as file:
+            stored = file.read()
+        self.assertEqual(Image.open(BytesIO(stored)).size, (20, 10))
+        self.assertEqual(post.image_hash, hashlib.sha256(stored).hexdigest())
+        self.assertEqual(self.staged_files(), [])
+
+    def test_csrf_still_checked(self):
+        """Обработчик подключается только во view поста, и CSRF
+        для них по-прежнему проверяется.
+        """
+        self.assertNotIn(
+            'posts.uploads.StreamingImageUploadHandler',
+            settings.FILE_UPLOAD_HANDLERS)
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        response = client.post(reverse('posts:post_create'), {
+            'text': 'csrf',
+            'image': SimpleUploadedFile('csrf.png', png_bytes()),
+        })
+        self.assertTemplateUsed(response, 'core/403csrf.html')
+        self.assertFalse(Post.objects.filter(text='csrf').exists())
@@ -1,13 +1,24 @@
 from http import HTTPStatus
+from io import StringIO
+from unittest import mock
 
 from django.contrib.auth import get_user_model
-from django.test import TestCase, Client
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.conf import settings
 from django.urls import reverse
 from django.core.cache import cache
 from django import forms
 
-from posts.models import Post, Group, Follow
+from core import stampede
+from core.fragment_cache import fragment_stats, get_fragment, set_fragment
+from core.stampede import stampede_stats
+from posts import views
+from posts.follow_cache import followed_ids, following_among, is_following
+from posts.models import Post, Group, Follow, FeedEntry, Comment, Profile
+from posts.paginators import CursorPaginator, encode_cursor
 
 
 User = get_user_model()
@@ -170,6 +181,146 @@ class PaginatorViewsTest(TestCase):
             reverse('posts:index') + f'?page={second_page}')
         self.assertEqual(len(response.context['page_obj']), second_page)
 
+    def test_cursor_pages(self):
+        """Курсоры ?after=/?before= листают ленту вперёд и назад.
+        """
+        first_page = self.authorized_client.get(
+            reverse('posts:index')).context['page_obj']
+        next_cursor = first_page.paginator.next_cursor
+        self.assertTrue(first_page.has_next())
+        self.assertFalse(first_page.has_previous())
+        second_page = self.authorized_client.get(
+            reverse('posts:index') + f'?after={next_cursor}'
+        ).context['page_obj']
+        self.assertEqual(
+            len(second_page), Post.objects.count() - settings.MAX)
+        self.assertFalse(second_page.has_next())
+        self.assertTrue(
+            set(first_page).isdisjoint(set(second_page)))
+        previous_cursor = second_page.paginator.previous_cursor
+        back_page = self.authorized_client.get(
+            reverse('posts:index') + f'?before={previous_cursor}'
+        ).context['page_obj']
+        self.assertEqual(list(back_page), list(first_page))
+
+    def test_oversized_cursor(self):
+        """Курсор с id за пределами 64-битного целого считается
+        битым: отдаётся первая страница, а не ошибка базы.
+        """
+        cursor = encode_cursor(self.posts[0].pub_date, 10 ** 30)
+        for address in (
+            reverse('posts:index'),
+            reverse('posts:profile', args=[self.author.username]),
+        ):
+            with self.subTest(address=address):
+                response = self.authorized_client.get(
+                    address, {'after': cursor})
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+                self.assertFalse(response.context['page_obj'].has_previous())
+
+    def test_cursor_page_without_count(self):
+        """Страница по курсору не выполняет COUNT(*).
+        """
+        post_list = Post.objects.all()
+        with self.assertNumQueries(1):
+            page = CursorPaginator(post_list, settings.MAX).page()
+            self.assertEqual(len(page), settings.MAX)
+
+
+class RenameInvalidationTests(TestCase):
+    """Переименование группы или пользователя сбрасывает все
+    закешированные страницы, где они видны.
+    """
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='old_name')
+        cls.reader = User.objects.create_user(username='commenter')
+        cls.group = Group.objects.create(title='Старая группа', slug='old')
+        cls.post = Post.objects.create(
+            author=cls.author, text='Пост в группе', group=cls.group)
+        Comment.objects.create(
+            post=cls.post, author=cls.reader, text='Комментарий')
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def pages(self):
+        return (
+            reverse('posts:index'),
+            reverse('posts:post_detail', args=[self.post.pk]),
+            reverse('posts:profile', args=[self.author.username]),
+        )
+
+    def test_group_rename(self):
+        old_link = reverse('posts:group_list', args=['old'])
+        for address in self.pages():
+            self.assertContains(self.client.get(address), old_link)
+        group = Group.objects.get(pk=self.group.pk)
+        group.title = 'Новая группа'
+        group.slug = 'new'
+        group.save()
+        for address in self.pages():
+            with self.subTest(address=address):
+                response = self.client.get(address)
+                self.assertNotContains(response, old_link)
+                self.assertContains(
+                    response, reverse('posts:group_list', args=['new']))
+        self.assertContains(
+            self.client.get(self.pages()[1]), 'Новая группа')
+
+    def test_group_delete(self):
+        old_link = reverse('posts:group_list', args=['old'])
+        address = reverse('posts:profile', args=[self.author.username])
+        self.assertContains(self.client.get(address), old_link)
+        Group.objects.get(pk=self.group.pk).delete()
+        self.assertNotContains(self.client.get(address), old_link)
+
+    def test_username_change(self):
+        """Ссылки на профиль в ленте, группе и под чужим постом
+        ведут на новое имя.
+        """
+        own_post = Post.objects.create(author=self.reader, text='Свой пост')
+        addresses = (
+            reverse('posts:index'),
+            reverse('posts:group_list', args=[self.group.slug]),
+            reverse('posts:post_detail', args=[self.post.pk]),
+            reverse('posts:post_comments', args=[self.post.pk]),
+            reverse('posts:post_detail', args=[own_post.pk]),
+        )
+        for address in addresses:
+            self.client.get(address)
+        for user, username in ((self.author, 'new_name'),
+                               (self.reader, 'new_commenter')):
+            user = User.objects.get(pk=user.pk)
+            user.username = username
+            user.save()
+        expected = {
+            addresses[0]: 'new_name',
+            addresses[1]: 'new_name',
+            addresses[2]: 'new_commenter',
+            addresses[3]: 'new_commenter',
+            addresses[4]: 'new_commenter',
+        }
+        for address, username in expected.items():
+            with self.subTest(address=address):
+                self.assertContains(
+                    self.client.get(address),
+                    reverse('posts:profile', args=[username]))
+
+    def test_login_keeps_pages(self):
+        """Вход пользователя не сбрасывает страницы с его именем.
+        """
+        self.client.get(reverse('posts:index'))
+        author = User.objects.get(pk=self.author.pk)
+        author.set_password('password')
+        author.save()
+        self.client.get(reverse('posts:index'))
+        Client().login(username='old_name', password='password')
+        with self.assertNumQueries(0):
+            self.client.get(reverse('posts:index'))
+
 
 class CasheTests(TestCase):
     @classmethod
@@ -184,13 +335,17 @@ class CasheTests(TestCase):
     def setUp(self):
         self.authorized_client = Client()
         self.authorized_client.force_login(self.author)
+        # Счётчики статистики, накопленные другими тестами
+        stampede.flush()
+        cache.clear()
 
     def test_cache_index(self):
-        """Тестируем кеш шаблона index.
+        """Тестируем кеш шаблона index: изменение в обход сигналов
+        не видно, пока кеш не очищен.
         """
         response = self.authorized_client.get(
             reverse('posts:index')).content
-        self.post_cashe.delete()
+        Post.objects.filter(pk=self.post_cashe.pk).update(text='Обновлено')
         response_cashe = self.authorized_client.get(
             reverse('posts:index')).content
         self.assertEqual(response, response_cashe)
@@ -199,6 +354,157 @@ class CasheTests(TestCase):
             reverse('posts:index')).content
         self.assertNotEqual(response, response_clear)
 
+    def test_cache_invalidated_by_tags(self):
+        """Удаление поста сразу сбрасывает закешированные страницы
+        с его тегами.
+        """
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:profile', kwargs={
+                'username': self.author.username}),
+        )
+        for url in urls:
+            self.assertContains(self.authorized_client.get(url), 'Тест кеша')
+        self.post_cashe.delete()
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertNotContains(
+                    self.authorized_client.get(url), 'Тест кеша')
+
+    def test_index_fragment_varies_on_viewer(self):
+        """Фрагмент index общий для читателей, но автор постов
+        на странице получает свой вариант с кнопкой редактирования.
+        """
+        readers = []
+        for username in ('reader_1', 'reader_2'):
+            reader = Client()
+            reader.force_login(User.objects.create_user(username=username))
+            readers.append(reader)
+        self.assertContains(
+            self.authorized_client.get(reverse('posts:index')),
+            'Редактировать запись',
+        )
+        for reader in readers:
+            self.assertNotContains(
+                reader.get(reverse('posts:index')), 'Редактировать запись')
+        self.assertEqual(
+            fragment_stats('index_page'), {'hit': 1, 'miss': 2})
+
+    def test_fragment_hit_does_not_write_cache(self):
+        """Попадание во фрагмент только читает кеш: счётчик копится
+        в памяти процесса и доходит до кеша при чтении статистики.
+        """
+        set_fragment('fragment:test', 'content', {})
+        with mock.patch.object(cache, 'add') as add, \
+                mock.patch.object(cache, 'incr') as incr:
+            self.assertEqual(get_fragment('test', 'fragment:test'), 'content')
+        add.assert_not_called()
+        incr.assert_not_called()
+        self.assertEqual(fragment_stats('test'), {'hit': 1, 'miss': 0})
+
+    def test_fragment_keeps_versions_from_before_query(self):
+        """Пост, сохранённый между запросом view к базе и отрисовкой
+        фрагмента, не оставляет старый фрагмент свежим.
+        """
+        real_attach = views.attach_thumbnails
+
+        def attach_then_post(page_obj):
+            real_attach(page_obj)
+            Post.objects.create(author=self.author, text='Пост в гонке')
+
+        with mock.patch.object(views, 'attach_thumbnails', attach_then_post):
+            response = self.authorized_client.get(reverse('posts:index'))
+        self.assertNotContains(response, 'Пост в гонке')
+        self.assertContains(
+            self.authorized_client.get(reverse('posts:index')),
+            'Пост в гонке',
+        )
+
+    def test_stale_page_while_recomputing(self):
+        """Пока страницу пересчитывает другой запрос, отдаётся старая
+        копия, которую браузеру запрещено сохранять.
+        """
+        self.authorized_client.get(reverse('posts:index'))
+        Post.objects.create(author=self.author, text='Свежий пост')
+        with mock.patch('core.stampede.acquire', return_value=False):
+            response = self.authorized_client.get(reverse('posts:index'))
+        self.assertNotContains(response, 'Свежий пост')
+        self.assertIn('no-store', response['Cache-Control'])
+        self.assertContains(
+            self.authorized_client.get(reverse('posts:index')),
+            'Свежий пост',
+        )
+        self.assertEqual(
+            stampede_stats('page'),
+            {'recompute': 1, 'early': 0, 'collapsed': 1},
+        )
+
+    def test_stale_fragment_while_recomputing(self):
+        """Устаревший фрагмент отдаётся, пока его пересчитывают.
+        """
+        readers = []
+        for username in ('reader_1', 'reader_2'):
+            reader = Client()
+            reader.force_login(User.objects.create_user(username=username))
+            readers.append(reader)
+        readers[0].get(reverse('posts:index'))
+        Post.objects.create(author=self.author, text='Свежий пост')
+        with mock.patch('core.stampede.acquire', return_value=False):
+            response = readers[1].get(reverse('posts:index'))
+        self.assertNotContains(response, 'Свежий пост')
+        self.assertEqual(
+            stampede_stats('fragment:index_page')['collapsed'], 1)
+
+    def test_warm_cache(self):
+        """warm_cache рендерит главную, группы и профили через view
+        для хоста сайта, после чего анонимный запрос к ним с этим
+        хостом берётся из кеша.
+        """
+        Group.objects.create(title='Тёплая', slug='warm')
+        out = StringIO()
+        call_command('warm_cache', workers=1, host='localhost', stdout=out)
+        self.assertIn('Прогрето страниц: 3 из 3', out.getvalue())
+        addresses = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': 'warm'}),
+            reverse('posts:profile', kwargs={'username': 'mirymir'}),
+        )
+        for address in addresses:
+            with self.subTest(address=address):
+                with self.assertNumQueries(0):
+                    self.client.get(address, HTTP_HOST='localhost')
+
+    def test_warm_cache_host(self):
+        """Прогрев одного хоста не заполняет кеш страниц другого;
+        по умолчанию греется первый адрес из ALLOWED_HOSTS.
+        """
+        call_command('warm_cache', workers=1, host='localhost',
+                     stdout=StringIO())
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('posts:index'), HTTP_HOST='127.0.0.1')
+        self.assertTrue(queries)
+        cache.clear()
+        with self.settings(ALLOWED_HOSTS=['.example.com', 'example.com']):
+            call_command('warm_cache', workers=1, stdout=StringIO())
+            with self.assertNumQueries(0):
+                self.client.get(
+                    reverse('posts:index'), HTTP_HOST='example.com')
+
+    def test_cache_varies_on_user(self):
+        """Закешированная лента подписок одного пользователя
+        не отдаётся другому.
+        """
+        reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=reader, author=self.author)
+        reader_client = Client()
+        reader_client.force_login(reader)
+        self.assertContains(
+            reader_client.get(reverse('posts:follow_index')), 'Тест кеша')
+        self.assertNotContains(
+            self.authorized_client.get(reverse('posts:follow_index')),
+            'Тест кеша',
+        )
+
 
 class FollowTest(TestCase):
     def setUp(self):
@@ -214,6 +520,31 @@ class FollowTest(TestCase):
         )
         self.client_auth_follower.force_login(self.user_follower)
         self.client_auth_following.force_login(self.user_following)
+        cache.clear()
+
+    def test_follow_set_cache(self):
+        """Множество подписок читается из кеша и правится на месте
+        при подписке и отписке.
+        """
+        other = User.objects.create_user(username='Khlestakov')
+        follower_id = self.user_follower.pk
+        self.assertFalse(is_following(follower_id, other.pk))
+        Follow.objects.create(user=self.user_follower, author=other)
+        self.client_auth_follower.get(reverse(
+            'posts:profile_follow',
+            kwargs={'username': self.user_following.username}))
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                following_among(
+                    follower_id, [other.pk, self.user_following.pk, 0]),
+                {other.pk, self.user_following.pk},
+            )
+        self.client_auth_follower.get(reverse(
+            'posts:profile_unfollow',
+            kwargs={'username': self.user_following.username}))
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                list(followed_ids(follower_id)), [other.pk])
 
     def test_follow(self):
         self.client_auth_follower.get(reverse('posts:profile_follow', kwargs={
@@ -239,3 +570,222 @@ class FollowTest(TestCase):
         response = self.client_auth_following.get(
             reverse('posts:follow_index'))
         self.assertNotContains(response, self.post.text)
+
+    def test_new_post_fans_out_to_followers(self):
+        """Новый пост автора попадает в ленту подписчика.
+        """
+        Follow.objects.create(
+            user=self.user_follower, author=self.user_following)
+        new_post = Post.objects.create(
+            author=self.user_following, text='fan_out_post')
+        self.assertTrue(FeedEntry.objects.filter(
+            user=self.user_follower, post=new_post).exists())
+        self.assertFalse(FeedEntry.objects.filter(
+            user=self.user_following, post=new_post).exists())
+
+    def test_follow_backfills_and_unfollow_prunes_feed(self):
+        """Подписка заполняет ленту старыми постами, отписка чистит её.
+        """
+        self.client_auth_follower.get(reverse('posts:profile_follow', kwargs={
+            'username': self.user_following.username}))
+        self.assertTrue(FeedEntry.objects.filter(
+            user=self.user_follower, post=self.post).exists())
+        self.client_auth_follower.get(reverse(
+            'posts:profile_unfollow', kwargs={
+                'username': self.user_following.username}))
+        self.assertFalse(FeedEntry.objects.filter(
+            user=self.user_follower).exists())
+
+    @override_settings(FEED_FANOUT_THRESHOLD=1)
+    def test_hybrid_feed_merges_pulled_authors(self):
+        """Посты автора выше порога подписчиков не раскладываются,
+        а подмешиваются в ленту при чтении в порядке pub_date.
+        """
+        fan = User.objects.create_user(username='Khlestakov')
+        light_author = User.objects.create_user(username='Osip')
+        Follow.objects.create(user=fan, author=self.user_following)
+        Follow.objects.create(
+            user=self.user_follower, author=self.user_following)
+        Follow.objects.create(
+            user=self.user_follower, author=light_author)
+        heavy_post = Post.objects.create(
+            author=self.user_following, text='heavy_post')
+        light_post = Post.objects.create(
+            author=light_author, text='light_post')
+        self.assertFalse(
+            FeedEntry.objects.filter(post=heavy_post).exists())
+        self.assertTrue(
+            FeedEntry.objects.filter(post=light_post).exists())
+        response = self.client_auth_follower.get(
+            reverse('posts:follow_index'))
+        self.assertEqual(
+            list(response.context['page_obj']),
+            [light_post, heavy_post, self.post],
+        )
+
+    @override_settings(FEED_FANOUT_THRESHOLD=2, FEED_FANOUT_HYSTERESIS=0.5)
+    def test_author_back_under_threshold_keeps_feed(self):
+        """Автор переходит на подтягивание выше порога, а к раскладке
+        его возвращает команда resume_fan_out, только когда подписчиков
+        осталось не больше доли порога. Посты, написанные, пока он
+        подтягивался, и старые посты подписчиков, пришедших в это
+        время, остаются в ленте.
+        """
+        fans = [
+            User.objects.create_user(username=name)
+            for name in ('Khlestakov', 'Osip')
+        ]
+        for fan in fans:
+            Follow.objects.create(user=fan, author=self.user_following)
+        Follow.objects.create(
+            user=self.user_follower, author=self.user_following)
+        pulled_post = Post.objects.create(
+            author=self.user_following, text='pulled_post')
+        self.assertFalse(FeedEntry.objects.filter(
+            user=self.user_follower).exists())
+        feed = [pulled_post, self.post]
+        for fan, resumed in zip(fans, ('0', '1')):
+            fan.follower.all().delete()
+            response = self.client_auth_follower.get(
+                reverse('posts:follow_index'))
+            self.assertEqual(list(response.context['page_obj']), feed)
+            out = StringIO()
+            call_command('resume_fan_out', chunk_size=1, stdout=out)
+            self.assertIn(f'авторов: {resumed}', out.getvalue())
+        self.assertFalse(Profile.objects.get(
+            user=self.user_following).feed_pulled)
+        self.assertEqual(
+            set(FeedEntry.objects.filter(
+                user=self.user_follower).values_list('post', flat=True)),
+            {pulled_post.pk, self.post.pk},
+        )
+        # Лента не изменилась, поэтому страница в кеше осталась прежней
+        cache.clear()
+        response = self.client_auth_follower.get(
+            reverse('posts:follow_index'))
+        self.assertEqual(list(response.context['page_obj']), feed)
+        pushed_post = Post.objects.create(
+            author=self.user_following, text='pushed_post')
+        self.assertTrue(FeedEntry.objects.filter(
+            user=self.user_follower, post=pushed_post).exists())
+
+    def test_unfollow_keeps_author_pulled(self):
+        """Отписка сама не возвращает автора к раскладке и не пишет
+        в ленты.
+        """
+        Follow.objects.create(
+            user=self.user_follower, author=self.user_following)
+        Profile.objects.filter(
+            user=self.user_following).update(feed_pulled=True)
+        with self.assertNumQueries(4):
+            Follow.objects.filter(user=self.user_follower).delete()
+        self.assertTrue(Profile.objects.get(
+            user=self.user_following).feed_pulled)
+
+
+@override_settings(COMMENTS_PER_PAGE=2)
+class CommentPagesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Lyapkin')
+        cls.post = Post.objects.create(author=cls.author, text='comments')
+        for i in range(3):
+            Comment.objects.create(
+                post=cls.post, author=cls.author, text=f'comment {i}')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_post_detail_shows_first_comments_page(self):
+        """На странице поста только первая страница комментариев.
+        """
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}))
+        comments = response.context['comments']
+        self.assertEqual(
+            [comment.text for comment in comments],
+            ['comment 2', 'comment 1'],
+        )
+        self.assertContains(response, 'data-load-more')
+
+    def test_load_more_fragment(self):
+        """Фрагмент «Показать ещё» отдаёт следующую страницу.
+        """
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}))
+        next_cursor = response.context['comments'].paginator.next_cursor
+        response = self.client.get(
+            reverse('posts:post_comments', kwargs={'post_id': self.post.pk})
+            + f'?after={next_cursor}')
+        self.assertEqual(
+            [comment.text for comment in response.context['comments']],
+            ['comment 0'],
+        )
+        self.assertNotContains(response, 'data-load-more')
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Etag')
+        cls.group = Group.objects.create(title='etag', slug='etag')
+        cls.post = Post.objects.create(
+            author=cls.author, text='etag', group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+        self.addresses = [
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+            reverse('posts:profile', kwargs={'username': 'Etag'}),
+            reverse('posts:group_list', kwargs={'slug': 'etag'}),
+        ]
+
+    def test_not_modified(self):
+        """Повторный запрос с валидаторами получает 304 без тела.
+        """
+        for address in self.addresses:
+            with self.subTest(address=address):
+                response = self.client.get(address)
+                self.assertIn('max-age=0', response['Cache-Control'])
+                etag = response['ETag']
+                response = self.client.get(
+                    address, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(
+                    response.status_code, HTTPStatus.NOT_MODIFIED)
+                self.assertEqual(response.content, b'')
+                response = self.client.get(
+                    address,
+                    HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+                self.assertEqual(
+                    response.status_code, HTTPStatus.NOT_MODIFIED)
+
+    def test_changed_after_new_post(self):
+        """Новый пост меняет ETag страниц автора, группы и поста.
+        """
+        etags = [self.client.get(address)['ETag']
+                 for address in self.addresses]
+        Post.objects.create(author=self.author, text='new', group=self.group)
+        for address, etag in zip(self.addresses, etags):
+            with self.subTest(address=address):
+                response = self.client.get(address, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+                self.assertNotEqual(response['ETag'], etag)
+
+    def test_etag_differs_per_user(self):
+        """Авторизованный пользователь не получает 304 по ETag гостя.
+        """
+        address = self.addresses[0]
+        etag = self.client.get(address)['ETag']
+        client = Client()
+        client.force_login(self.author)
+        response = client.get(address, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_missing_object(self):
+        """Для несуществующих объектов по-прежнему 404.
+        """
+        response = self.client.get(
+            reverse('posts:profile', kwargs={'username': 'nobody'}))
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
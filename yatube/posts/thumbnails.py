@@ -0,0 +1,280 @@
+"""Миниатюры картинок постов.
+
+Варианты из THUMBNAIL_VARIANTS и THUMBNAIL_SRCSET генерируются
+заранее, сразу после сохранения поста, в фоновом пуле потоков —
+первый читатель уже не платит за декодирование и кадрирование.
+Одновременные запросы одного и того же варианта внутри процесса
+ждут одну генерацию (SingleFlightBackend подключается через
+THUMBNAIL_BACKEND).
+
+Для страницы постов миниатюры находятся пачкой: attach_thumbnails
+вешает на посты ленивый post.thumbnail, и первое обращение шаблона
+одним get_many из хранилища sorl находит миниатюры всей страницы.
+Для srcset те же картинки режутся в нескольких ширинах в современном
+формате (THUMBNAIL_SRCSET), и браузер выбирает наименьшую подходящую.
+"""
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Lock
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils.functional import SimpleLazyObject
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.helpers import toint
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE
+from sorl.thumbnail.parsers import parse_geometry
+
+from posts.images import can_save
+
+logger = logging.getLogger(__name__)
+
+_flights = {}
+_flights_lock = Lock()
+_pool = None
+_pool_lock = Lock()
+
+
+def single_flight(key, compute):
+    """Вызывает compute() один раз на key, сколько бы потоков ни
+    попросили его одновременно; остальные получают тот же результат.
+    """
+    with _flights_lock:
+        future = _flights.get(key)
+        owner = future is None
+        if owner:
+            future = Future()
+            _flights[key] = future
+    if not owner:
+        return future.result()
+    try:
+        result = compute()
+    except BaseException as error:
+        future.set_exception(error)
+        raise
+    else:
+        future.set_result(result)
+        return result
+    finally:
+        with _flights_lock:
+            _flights.pop(key, None)
+
+
+class SingleFlightBackend(ThumbnailBackend):
+    """Бэкенд sorl, который не генерирует один вариант дважды
+    одновременно.
+    """
+
+    def get_thumbnail(self, file_, geometry_string, **options):
+        key = (
+            getattr(file_, 'name', file_),
+            geometry_string,
+            tuple(sorted(options.items())),
+        )
+        return single_flight(key, lambda: super(
+            SingleFlightBackend, self).get_thumbnail(
+                file_, geometry_string, **options))
+
+    def thumbnail_key(self, file_, geometry_string, options) -> str:
+        """Ключ миниатюры в хранилище sorl; параметры дополняются
+        так же, как в ThumbnailBackend.get_thumbnail.
+        """
+        source = ImageFile(file_)
+        options = dict(options)
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(sorl_defaults, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return add_prefix(ImageFile(name, default.storage).key)
+
+    def get_thumbnails(self, files, geometry_string, **options) -> list:
+        """Миниатюры для нескольких картинок: найденные читаются одним
+        get_many из кеша хранилища, остальные — через get_thumbnail.
+        """
+        cache = getattr(default.kvstore, 'cache', None)
+        found = {}
+        keys = [
+            self.thumbnail_key(file_, geometry_string, options)
+            for file_ in files
+        ]
+        if cache is not None:
+            found = cache.get_many(keys)
+        thumbnails = []
+        for file_, key in zip(files, keys):
+            value = found.get(key)
+            if value and value is not EMPTY_VALUE:
+                thumbnails.append(deserialize_image_file(value))
+            else:
+                thumbnails.append(
+                    self.get_thumbnail(file_, geometry_string, **options))
+        return thumbnails
+
+
+def pool() -> ThreadPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(
+                settings.THUMBNAIL_WORKERS, thread_name_prefix='thumbnails')
+        return _pool
+
+
+def generate(image) -> list:
+    """Генерирует все варианты миниатюр картинки в текущем потоке.
+    """
+    return [
+        get_thumbnail(image, geometry, **options)
+        for geometry, options in (
+            *settings.THUMBNAIL_VARIANTS, *srcset_variants())
+    ]
+
+
+def _generate_in_pool(image) -> list:
+    try:
+        return generate(image)
+    finally:
+        connections.close_all()
+
+
+def _log_failure(future: Future) -> None:
+    if future.exception() is not None:
+        logger.error(
+            'Не удалось сгенерировать миниатюры',
+            exc_info=future.exception())
+
+
+def pregenerate(image):
+    """Отдаёт картинку пулу после фиксации транзакции. При
+    THUMBNAIL_WORKERS = 0 миниатюры генерируются сразу.
+    """
+    if not image:
+        return
+
+    def submit():
+        if not settings.THUMBNAIL_WORKERS:
+            generate(image)
+            return
+        pool().submit(_generate_in_pool, image).add_done_callback(
+            _log_failure)
+
+    transaction.on_commit(submit)
+
+
+def srcset_variants() -> list:
+    """Варианты THUMBNAIL_SRCSET с форматом THUMBNAIL_SRCSET_FORMAT или
+    пустой список, если Pillow не умеет его сохранять.
+    """
+    image_format = settings.THUMBNAIL_SRCSET_FORMAT
+    if not image_format or not can_save(image_format):
+        return []
+    return [
+        (geometry, dict(options, format=image_format))
+        for geometry, options in settings.THUMBNAIL_SRCSET
+    ]
+
+
+def display_size(width: int, height: int, variant) -> tuple:
+    """Размер миниатюры варианта для картинки width x height, как его
+    посчитает sorl (масштаб, upscale, crop, padding), но по сохранённым
+    размерам картинки — без хранилища миниатюр.
+    """
+    geometry, options = variant
+    options = dict(ThumbnailBackend.default_options, **options)
+    box = parse_geometry(geometry, width / height)
+    if options['padding']:
+        return box
+    crop = options['crop']
+    factors = (box[0] / width, box[1] / height)
+    factor = max(factors) if crop else min(factors)
+    if factor < 1 or options['upscale']:
+        width, height = toint(width * factor), toint(height * factor)
+    if crop and crop != 'noop':
+        width, height = min(width, box[0]), min(height, box[1])
+    return width, height
+
+
+def _batch(images, variant):
+    """Функция индекс -> миниатюра для варианта; миниатюры всех
+    картинок находятся одной пачкой при первом вызове.
+    """
+    geometry, options = variant
+    resolved = []
+
+    def thumbnail_of(index):
+        if not resolved:
+            try:
+                # Без размера sorl отдаёт миниатюру несуществующего файла
+                resolved.extend(
+                    thumbnail if thumbnail is not None and thumbnail.size
+                    else None
+                    for thumbnail in default.backend.get_thumbnails(
+                        images, geometry, **options))
+            except Exception:
+                logger.exception('Не удалось найти миниатюры страницы')
+                resolved.extend([None] * len(images))
+        return resolved[index]
+    return thumbnail_of
+
+
+def _srcset(sources, index) -> str:
+    candidates = []
+    for width, thumbnail_of in sources:
+        thumbnail = thumbnail_of(index)
+        if thumbnail is not None:
+            candidates.append(f'{thumbnail.url} {width}w')
+    return ', '.join(candidates)
+
+
+def attach_thumbnails(posts, variant=None):
+    """Вешает на посты ленивые post.thumbnail для варианта (по умолчанию
+    первого из THUMBNAIL_VARIANTS) и post.srcset из вариантов
+    srcset_variants(); post.srcset_type — MIME-тип этих вариантов.
+    Миниатюры всех постов находятся пачкой на вариант при первом
+    обращении; если шаблон взят из кеша фрагментов, обращения
+    не будет вовсе.
+
+    post.thumbnail_width и post.thumbnail_height считаются по размерам
+    картинки из полей поста; только у постов, которым их ещё
+    не заполнил backfill_image_metadata, их лениво даёт sorl.
+    """
+    variant = variant or settings.THUMBNAIL_VARIANTS[0]
+    with_images = [post for post in posts if post.image]
+    images = [post.image for post in with_images]
+    thumbnail_of = _batch(images, variant)
+    sources = [
+        (geometry.split('x')[0], _batch(images, (geometry, options)))
+        for geometry, options in srcset_variants()
+    ]
+    srcset_type = ''
+    if sources:
+        srcset_type = f'image/{settings.THUMBNAIL_SRCSET_FORMAT.lower()}'
+    for post in posts:
+        post.thumbnail = None
+        post.thumbnail_width = post.thumbnail_height = None
+        post.srcset = ''
+        post.srcset_type = srcset_type
+    for index, post in enumerate(with_images):
+        post.thumbnail = SimpleLazyObject(
+            lambda index=index: thumbnail_of(index))
+        if post.image_width and post.image_height:
+            post.thumbnail_width, post.thumbnail_height = display_size(
+                post.image_width, post.image_height, variant)
+        else:
+            post.thumbnail_width = SimpleLazyObject(
+                lambda index=index: getattr(thumbnail_of(index), 'width', 0))
+            post.thumbnail_height = SimpleLazyObject(
+                lambda index=index: getattr(thumbnail_of(index), 'height', 0))
+        if sources:
+            post.srcset = SimpleLazyObject(
+                lambda index=index: _srcset(sources, index))
+    return posts
@@ -0,0 +1,170 @@
+"""Потоковая загрузка картинок.
+
+Декоратор image_uploads подключает StreamingImageUploadHandler
+к view создания и правки поста; остальные загрузки сайта (админка,
+другие FileField) идут через стандартные обработчики Django.
+Обработчик пишет куски загрузки сразу на диск —
+в IMAGE_UPLOAD_TEMP_DIR, по умолчанию скрытый каталог внутри
+MEDIA_ROOT, — и считает SHA-256 по мере приёма. Хранилище
+картинок (posts/storage.py) переименовывает такой файл на его
+постоянное место без копирования и без повторного хеширования.
+
+Загрузка отбрасывается с первых байт, если это не картинка
+известного формата, если заголовок картинки обещает больше
+Image.MAX_IMAGE_PIXELS пикселей или если файл больше
+IMAGE_UPLOAD_MAX_SIZE. Остаток такой загрузки дочитывается
+без записи, а форма получает RejectedUpload с причиной.
+"""
+import hashlib
+import os
+import tempfile
+from functools import wraps
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.uploadedfile import (
+    SimpleUploadedFile, TemporaryUploadedFile, UploadedFile,
+)
+from django.core.files.uploadhandler import FileUploadHandler
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from PIL import Image
+
+# Начала файлов форматов, которые принимает ImageField поста
+SIGNATURES = (
+    b'\xff\xd8\xff',
+    b'\x89PNG\r\n\x1a\n',
+    b'GIF87a',
+    b'GIF89a',
+    b'BM',
+)
+# Сколько первых байт читать в поисках размеров картинки; если
+# заголовок длиннее, размеры проверит ImageField
+HEADER_LIMIT = 256 * 1024
+
+
+def looks_like_image(head: bytes) -> bool:
+    """Начинаются ли данные с сигнатуры известного формата картинки.
+    """
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return True
+    return head.startswith(SIGNATURES)
+
+
+def header_size(head: bytes):
+    """Размеры картинки из её начала или None, если заголовок
+    ещё не целиком.
+    """
+    try:
+        return Image.open(BytesIO(head)).size
+    except Image.DecompressionBombError:
+        raise
+    except Exception:
+        return None
+
+
+def upload_temp_dir() -> str:
+    return settings.IMAGE_UPLOAD_TEMP_DIR or os.path.join(
+        settings.MEDIA_ROOT, '.uploads')
+
+
+class StreamingUploadedFile(TemporaryUploadedFile):
+    """Загруженный файл во временном каталоге рядом с хранилищем.
+    sha256 заполняется после приёма последнего куска.
+    """
+
+    def __init__(self, name, content_type, size, charset,
+                 content_type_extra=None):
+        directory = upload_temp_dir()
+        os.makedirs(directory, exist_ok=True)
+        _, extension = os.path.splitext(name)
+        file = tempfile.NamedTemporaryFile(
+            suffix=f'.upload{extension}', dir=directory)
+        UploadedFile.__init__(
+            self, file, name, content_type, size, charset,
+            content_type_extra)
+        self.sha256 = None
+
+
+class RejectedUpload(SimpleUploadedFile):
+    """Пустой файл на месте отброшенной загрузки; error — причина.
+    """
+
+    def __init__(self, name, error):
+        super().__init__(name, b'')
+        self.error = error
+
+
+class StreamingImageUploadHandler(FileUploadHandler):
+    """Обработчик загрузки, который пишет картинку на диск по кускам,
+    хеширует её на лету и рано отбрасывает неподходящие данные.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.file = StreamingUploadedFile(
+            self.file_name, self.content_type, 0, self.charset,
+            self.content_type_extra)
+        self.digest = hashlib.sha256()
+        self.head = b''
+        self.size_checked = False
+        self.error = None
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.error is not None:
+            return None
+        if start + len(raw_data) > settings.IMAGE_UPLOAD_MAX_SIZE:
+            limit = settings.IMAGE_UPLOAD_MAX_SIZE // (1024 * 1024)
+            return self.reject(f'Картинка больше {limit} МБ.')
+        if not self.size_checked and start < HEADER_LIMIT:
+            self.head += raw_data
+            if not looks_like_image(self.head[:12]):
+                return self.reject(
+                    'Загрузите картинку в формате JPEG, PNG, GIF, '
+                    'WebP или BMP.')
+            try:
+                size = header_size(self.head)
+            except Image.DecompressionBombError:
+                return self.reject('Слишком большое разрешение.')
+            if size is not None:
+                self.size_checked = True
+                self.head = b''
+                limit = Image.MAX_IMAGE_PIXELS
+                if limit and size[0] * size[1] > limit:
+                    return self.reject('Слишком большое разрешение.')
+        self.digest.update(raw_data)
+        self.file.write(raw_data)
+        return None
+
+    def reject(self, error: str):
+        self.error = error
+        self.head = b''
+        self.file.close()
+        return None
+
+    def file_complete(self, file_size):
+        if self.error is not None:
+            return RejectedUpload(self.file_name, self.error)
+        self.file.seek(0)
+        self.file.size = file_size
+        self.file.sha256 = self.digest.hexdigest()
+        return self.file
+
+    def upload_interrupted(self):
+        if hasattr(self, 'file'):
+            self.file.close()
+
+
+def image_uploads(view):
+    """Принимает загрузки view через StreamingImageUploadHandler.
+    Обработчики можно сменить только до разбора тела запроса, а его
+    разбирает CsrfViewMiddleware, поэтому проверка CSRF переносится
+    внутрь: снаружи csrf_exempt, после смены обработчиков csrf_protect.
+    """
+    protected = csrf_protect(view)
+
+    @csrf_exempt
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        request.upload_handlers = [StreamingImageUploadHandler(request)]
+        return protected(request, *args, **kwargs)
+    return wrapper
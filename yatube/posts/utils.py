@@ -0,0 +1,79 @@
+from django.conf import settings
+from django.core.paginator import Page, Paginator
+from django.http import HttpRequest
+from django.utils.http import urlencode
+
+from posts.paginators import CursorPaginator, MergedCursorPaginator
+from posts.search import SearchPaginator, fts_available, match_expression
+
+
+def paginate(request: HttpRequest, post_list,
+             cursor_fields=('pub_date', 'pk'), count=None) -> Page:
+    """Возвращает страницу ленты. По умолчанию лента листается
+    курсорами ?after=/?before= без COUNT(*); старые ссылки
+    вида ?page=N обслуживает обычный Paginator. Известное заранее
+    число записей count избавляет его от лишнего COUNT(*).
+    """
+    if 'page' in request.GET:
+        paginator = Paginator(post_list, settings.MAX)
+        if count is not None:
+            paginator.count = count
+        return paginator.get_page(request.GET.get('page'))
+    paginator = CursorPaginator(
+        post_list,
+        settings.MAX,
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+        cursor_fields=cursor_fields,
+    )
+    return paginator.page()
+
+
+def paginate_sources(request: HttpRequest, sources) -> Page:
+    """Курсорная страница, слитая из нескольких упорядоченных источников.
+    """
+    paginator = MergedCursorPaginator(
+        sources,
+        settings.MAX,
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+    )
+    return paginator.page()
+
+
+def paginate_comments(request: HttpRequest, comments) -> Page:
+    """Страница комментариев по курсору ?after= на ключе (created, id).
+    """
+    paginator = CursorPaginator(
+        comments.select_related('author'),
+        settings.COMMENTS_PER_PAGE,
+        after=request.GET.get('after'),
+        cursor_fields=('created', 'pk'),
+    )
+    return paginator.page()
+
+
+def paginate_search(request: HttpRequest, post_list, query: str) -> Page:
+    """Страница результатов поиска по релевантности с курсором
+    ?after=/?before=. Без FTS5 ищет вхождение текста в ленте
+    по дате; пустой запрос даёт пустую страницу.
+    """
+    query_string = urlencode({'q': query}) + '&'
+    match = match_expression(query)
+    if not match or not fts_available():
+        if match:
+            post_list = post_list.filter(text__icontains=query)
+        else:
+            post_list = post_list.none()
+        page = paginate(request, post_list)
+        page.paginator.query = query_string
+        return page
+    paginator = SearchPaginator(
+        post_list,
+        settings.MAX,
+        match,
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+        query=query_string,
+    )
+    return paginator.page()
@@ -1,25 +1,37 @@
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
-from django.http import HttpRequest, HttpResponse
+from django.http import HttpRequest, HttpResponse, JsonResponse
 from django.shortcuts import redirect, render, get_object_or_404
 from django.conf import settings
-from django.views.decorators.cache import cache_page
+from django.urls import reverse
+from django.views.decorators.vary import vary_on_cookie
 
-from posts.models import Post, Group, User, Follow
+from core.cache_tags import cache_page_tagged, tag_request
+from core.conditional import condition_on_tags
+from core.object_cache import cached_object, get_cached_or_404
+from posts.autocomplete import suggest
+from posts.models import Post, Group, User, Follow, Comment
+from posts.counters import author_post_count
+from posts.feeds import follow_feed, pulled_authors
+from posts.follow_cache import followed_ids, is_following
 from posts.forms import PostForm, CommentForm
+from posts.thumbnails import attach_thumbnails, pregenerate
+from posts.uploads import image_uploads
+from posts.utils import (
+    paginate, paginate_comments, paginate_search, paginate_sources,
+)
 
 
-@cache_page(20)
+@cache_page_tagged(settings.PAGE_CACHE_TIMEOUT, 'feed:index')
+@vary_on_cookie
 def index(request: HttpRequest) -> HttpResponse:
     """View-функция обработчик. Принимающая на вход объект
     запроса HttpRequest, возвращающая объект ответа HttpResponse.
     Возвращается Html-шаблон index.html.
     """
     title = 'Последние обновления на сайте'
-    post_list = Post.objects.select_related('group')
-    paginator = Paginator(post_list, settings.MAX)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    post_list = Post.objects.select_related('author', 'group')
+    page_obj = paginate(request, post_list)
+    attach_thumbnails(page_obj)
     context = {
         'page_obj': page_obj,
         'title': title,
@@ -27,19 +39,83 @@ def index(request: HttpRequest) -> HttpResponse:
     return render(request, 'posts/index.html', context)
 
 
+def search(request: HttpRequest) -> HttpResponse:
+    """Поиск постов по тексту и группе, самые релевантные первыми.
+    Страница не кешируется: запросов слишком много разных.
+    """
+    query = request.GET.get('q', '').strip()
+    post_list = Post.objects.select_related('author', 'group')
+    page_obj = paginate_search(request, post_list, query)
+    attach_thumbnails(page_obj)
+    context = {
+        'page_obj': page_obj,
+        'query': query,
+    }
+    return render(request, 'posts/search.html', context)
+
+
+def autocomplete(request: HttpRequest) -> JsonResponse:
+    """Подсказки авторов и групп по началу username, slug или
+    названия группы: ?q=префикс&limit=N. Отвечает из индекса
+    в памяти, без запросов к базе.
+    """
+    try:
+        limit = int(request.GET.get('limit', settings.AUTOCOMPLETE_LIMIT))
+    except ValueError:
+        limit = settings.AUTOCOMPLETE_LIMIT
+    limit = max(0, min(limit, settings.AUTOCOMPLETE_LIMIT))
+    results = []
+    for kind, value, label in suggest(request.GET.get('q', ''), limit):
+        if kind == 'user':
+            url = reverse('posts:profile', kwargs={'username': value})
+        else:
+            url = reverse('posts:group_list', kwargs={'slug': value})
+        results.append(
+            {'type': kind, 'value': value, 'label': label, 'url': url})
+    return JsonResponse({'results': results})
+
+
+def group_tags(request: HttpRequest, slug: str):
+    """Теги страницы группы для условного GET.
+    """
+    return [f'group:{slug}']
+
+
+def profile_tags(request: HttpRequest, username: str):
+    """Теги страницы автора; None, если автора нет.
+    """
+    author = cached_object(User, 'username', username)
+    if author is None:
+        return None
+    return [f'author:{author.pk}']
+
+
+def post_tags(request: HttpRequest, post_id: str):
+    """Теги страницы поста; None, если поста нет.
+    """
+    author_id = Post.objects.filter(pk=post_id).values_list(
+        'author_id', flat=True).first()
+    if author_id is None:
+        return None
+    return [f'post:{post_id}', f'author:{author_id}']
+
+
+@condition_on_tags(group_tags)
+@cache_page_tagged(settings.PAGE_CACHE_TIMEOUT)
+@vary_on_cookie
 def group_posts(request: HttpRequest, slug: str) -> HttpResponse:
     """View-функция обработчик. Принимающая на вход объект
     запроса HttpRequest, возвращающая объект ответа HttpResponse.
     Возвращается Html-шаблон group_list.html.
     """
     tittle = 'Записи соообщества'
-    group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.select_related("group")
-    post_count = posts.count()
-    post_list = Post.objects.filter(group=group)
-    paginator = Paginator(post_list, settings.MAX)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    group = get_cached_or_404(Group, 'slug', slug)
+    tag_request(request, f'group:{group.slug}')
+    post_count = group.post_count
+    post_list = Post.objects.filter(group=group).select_related(
+        'author', 'group')
+    page_obj = paginate(request, post_list, count=post_count)
+    attach_thumbnails(page_obj)
     context = {
         'tittle': tittle,
         'group': group,
@@ -49,27 +125,29 @@ def group_posts(request: HttpRequest, slug: str) -> HttpResponse:
     return render(request, 'posts/group_list.html', context)
 
 
+@condition_on_tags(profile_tags)
+@cache_page_tagged(settings.PAGE_CACHE_TIMEOUT)
+@vary_on_cookie
 def profile(request: HttpRequest, username: str) -> HttpResponse:
     """View-функция обработчик. Принимающая на вход объект
     запроса HttpRequest, возвращающая объект ответа HttpResponse.
     Возвращается Html-шаблон profile.html.
     """
     title = f'Профайл пользователя {username}'
-    author = get_object_or_404(User, username=username)
-    posts = author.posts.select_related("author")
-    post_count = posts.count()
-    post_list = Post.objects.filter(author=author)
-    paginator = Paginator(post_list, settings.MAX)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    author = get_cached_or_404(User, 'username', username)
+    tag_request(request, f'author:{author.pk}')
+    post_count = author_post_count(author)
+    post_list = Post.objects.filter(author=author).select_related(
+        'author', 'group')
+    page_obj = paginate(request, post_list, count=post_count)
+    attach_thumbnails(page_obj)
     following = False
     if request.user.is_authenticated:
-        following = Follow.objects.filter(
-            user=request.user, author=author).exists()
+        following = is_following(request.user.pk, author.pk)
     context = {
         'title': title,
         'author': author,
-        'posts': posts,
+        'posts': post_list,
         'post_count': post_count,
         'page_obj': page_obj,
         'following': following,
@@ -77,17 +155,22 @@ def profile(request: HttpRequest, username: str) -> HttpResponse:
     return render(request, 'posts/profile.html', context)
 
 
+@condition_on_tags(post_tags)
+@cache_page_tagged(settings.PAGE_CACHE_TIMEOUT)
+@vary_on_cookie
 def post_detail(request: HttpRequest, post_id: str) -> HttpResponse:
     """View-функция обработчик. Принимающая на вход объект
     запроса HttpRequest, возвращающая объект ответа HttpResponse.
     Возвращается Html-шаблон post_details.html.
     """
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_object_or_404(
+        Post.objects.select_related('author__profile', 'group'), pk=post_id)
+    tag_request(request, f'post:{post.pk}', f'author:{post.author_id}')
+    attach_thumbnails([post])
     title = f'Пост {post.text}'
     author = post.author
-    author_posts = author.posts
-    post_count = author_posts.count()
-    comments = post.comments.all()
+    post_count = author_post_count(author)
+    comments = paginate_comments(request, post.comments.all())
     form = CommentForm(request.POST or None)
     context = {
         'post': post,
@@ -101,6 +184,7 @@ def post_detail(request: HttpRequest, post_id: str) -> HttpResponse:
 
 
 @login_required
+@image_uploads
 def post_create(request: HttpRequest) -> HttpResponse:
     """View-функция обработчик. Принимающая на вход объект
     запроса HttpRequest, возвращающая объект ответа HttpResponse.
@@ -121,17 +205,17 @@ def post_create(request: HttpRequest) -> HttpResponse:
             files=request.FILES or None
         )
         context['form'] = form
-    post = form.save(commit=False)
-    post.author = request.user
-    if request.user != post.author:
-        return render(request, 'posts/create_post.html', context)
     if not form.is_valid():
         return render(request, 'posts/create_post.html', context)
-    form.save()
+    post = form.save(commit=False)
+    post.author = request.user
+    post.save()
+    pregenerate(post.image)
     return redirect('posts:profile', username=request.user.username)
 
 
 @login_required
+@image_uploads
 def post_edit(request: HttpRequest, post_id: str) -> HttpResponse:
     """View-функция обработчик. Принимающая на вход объект
     запроса HttpRequest, возвращающая объект ответа HttpResponse.
@@ -162,10 +246,25 @@ def post_edit(request: HttpRequest, post_id: str) -> HttpResponse:
         return redirect('posts:profile', post.author)
     if not form.is_valid():
         return render(request, 'posts/create_post.html', context)
-    form.save()
+    post = form.save()
+    if 'image' in form.changed_data:
+        pregenerate(post.image)
     return redirect('posts:post_detail', post.pk)
 
 
+def post_comments(request: HttpRequest, post_id: int) -> HttpResponse:
+    """Фрагмент со следующей страницей комментариев поста
+    для кнопки «Показать ещё». Сам пост не загружается.
+    """
+    comments = paginate_comments(
+        request, Comment.objects.filter(post_id=post_id))
+    context = {
+        'comments': comments,
+        'post_id': post_id,
+    }
+    return render(request, 'posts/includes/comment_list.html', context)
+
+
 @login_required
 def add_comment(request, post_id):
     post = get_object_or_404(Post, id=post_id)
@@ -181,13 +280,18 @@ def add_comment(request, post_id):
 
 
 @login_required
+@cache_page_tagged(settings.PAGE_CACHE_TIMEOUT)
+@vary_on_cookie
 def follow_index(request):
-    author_id = Follow.objects.filter(
-        user=request.user).values_list('author', flat=True)
-    post_list = Post.objects.filter(author__id__in=author_id)
-    paginator = Paginator(post_list, settings.MAX)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    followed = followed_ids(request.user.pk)
+    tag_request(
+        request,
+        f'follow:{request.user.pk}',
+        *(f'author:{author_id}' for author_id in followed),
+    )
+    page_obj = paginate_sources(
+        request, follow_feed(request.user, pulled_authors(followed)))
+    attach_thumbnails(page_obj)
     context = {
         'page_obj': page_obj,
     }
@@ -197,7 +301,7 @@ def follow_index(request):
 @login_required
 def profile_follow(request, username):
     user = request.user
-    author = get_object_or_404(User, username=username)
+    author = get_cached_or_404(User, 'username', username)
     if request.user != author:
         Follow.objects.get_or_create(user=user, author=author)
     return redirect('posts:profile', username=username)
@@ -206,7 +310,7 @@ def profile_follow(request, username):
 @login_required
 def profile_unfollow(request, username):
     user = request.user
-    author = get_object_or_404(User, username=username)
+    author = get_cached_or_404(User, 'username', username)
     if request.user != author:
         Follow.objects.filter(user=user, author=author).delete()
     return redirect('posts:profile', username=username)
@@ -55,10 +55,11 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.media.MediaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.auth.CachedAuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -148,6 +149,14 @@ LOGIN_REDIRECT_URL = 'posts:index'
 EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'  # подключаем движок filebased.EmailBackend
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')  # директория, в которую будут складываться файлы писем
 MAX = 10  # Переменная
+# Посты авторов, у которых подписчиков больше порога, не раскладываются
+# по лентам при публикации, а подтягиваются при чтении ленты подписок
+FEED_FANOUT_THRESHOLD = 10000
+# Автор возвращается к раскладке, когда подписчиков остаётся не больше
+# этой доли порога; разрыв не даёт переключаться туда и обратно
+FEED_FANOUT_HYSTERESIS = 0.9
+# Комментариев на странице поста и в каждой догрузке «Показать ещё»
+COMMENTS_PER_PAGE = 20
 
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/2.2/howto/static-files/
@@ -155,9 +164,82 @@ MAX = 10  # Переменная
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
-# Бэкенд кеширования
+# Бэкенд кеширования: L1 в памяти каждого воркера поверх общего
+# для всех воркеров L2 в файле SQLite (core/cache_backends.py)
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache_backends.TieredCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {
+            'L1_MAX_ENTRIES': 1000,
+            'L1_MAX_BYTES': 64 * 1024 * 1024,
+            'SYNC_INTERVAL': 0.5,
+            # Предел записей в L2; сверх него при чистке удаляется
+            # треть записей, начиная с тех, что истекают раньше
+            'MAX_ENTRIES': 10000,
+        },
     }
 }
+# Тесты пишут кеш во временный каталог, а не в общий cache.sqlite3
+TEST_RUNNER = 'core.test_runner.TempCacheRunner'
+# Время жизни закешированных страниц. Страницы помечены тегами
+# и сбрасываются сигналами при изменении постов, комментариев
+# и подписок, поэтому срок может быть долгим
+PAGE_CACHE_TIMEOUT = 60 * 60
+# Сколько секунд после истечения срока или инвалидации запись ещё
+# отдаётся устаревшей, пока один процесс пересчитывает её
+CACHE_STALE_TIMEOUT = 60
+# Время жизни блокировки пересчёта: если пересчитывающий процесс упал,
+# пересчёт возьмёт на себя следующий запрос
+CACHE_RECOMPUTE_LOCK_TIMEOUT = 10
+# Сколько хранить в кеше группы и пользователей, найденных по slug
+# и username, и сколько помнить, что такого объекта нет
+OBJECT_CACHE_TIMEOUT = 60 * 60
+OBJECT_CACHE_MISS_TIMEOUT = 60
+# Сколько хранить в кеше множество авторов, на которых подписан
+# пользователь; подписки и отписки правят его на месте
+FOLLOW_CACHE_TIMEOUT = 60 * 60 * 24
+# Сессии читаются из кеша, изменения пишутся в базу пачками
+# не чаще раза в SESSION_WRITE_BEHIND_INTERVAL секунд (core/sessions.py)
+SESSION_ENGINE = 'core.sessions'
+SESSION_WRITE_BEHIND_INTERVAL = 30
+# Варианты миниатюр, которые шаблоны запрашивают у sorl-thumbnail; они
+# генерируются заранее при сохранении поста (posts/thumbnails.py)
+THUMBNAIL_VARIANTS = (
+    ('960x339', {'crop': 'center', 'upscale': True}),
+)
+THUMBNAIL_BACKEND = 'posts.thumbnails.SingleFlightBackend'
+# Варианты для srcset в формате THUMBNAIL_SRCSET_FORMAT; если Pillow
+# не умеет его сохранять, шаблоны отдают только THUMBNAIL_VARIANTS
+THUMBNAIL_SRCSET = (
+    ('480x170', {'crop': 'center', 'upscale': True}),
+    ('960x339', {'crop': 'center', 'upscale': True}),
+    ('1440x508', {'crop': 'center', 'upscale': True}),
+)
+THUMBNAIL_SRCSET_FORMAT = 'WEBP'
+# Потоков фоновой генерации миниатюр; 0 — генерировать сразу
+THUMBNAIL_WORKERS = 2
+# Загруженные картинки уменьшаются до IMAGE_MAX_SIZE пикселей по большей
+# стороне и пересохраняются без метаданных (posts/images.py)
+IMAGE_MAX_SIZE = 2048
+IMAGE_QUALITY = 85
+# Большая сторона размытой заглушки, которую шаблоны показывают
+# до загрузки картинки
+IMAGE_PLACEHOLDER_SIZE = 16
+# Как отдавать MEDIA_URL без DEBUG (core/media.py): None — сам Django
+# через wsgi.file_wrapper сервера, 'x-accel-redirect' (nginx)
+# или 'x-sendfile' (Apache, lighttpd)
+MEDIA_SENDFILE = None
+# internal location nginx, который смотрит в MEDIA_ROOT
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+# Имена файлов картинок и миниатюр задаёт их содержимое,
+# поэтому браузер может хранить их долго
+MEDIA_MAX_AGE = 60 * 60 * 24 * 365
+# Картинки постов пишутся на диск по кускам и хешируются на лету
+# (posts/uploads.py, только во view создания и правки поста); временный
+# каталог по умолчанию — MEDIA_ROOT/.uploads, чтобы готовый файл
+# переносился на место переименованием
+IMAGE_UPLOAD_TEMP_DIR = None
+IMAGE_UPLOAD_MAX_SIZE = 20 * 1024 * 1024
+# Сколько подсказок не больше отдаёт /autocomplete/ (posts/autocomplete.py)
+AUTOCOMPLETE_LIMIT = 10